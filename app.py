@@ -1,17 +1,8 @@
 import streamlit as st
 import pandas as pd
-from tabs_scripts.community_led_details import community_led_programs_sum_with_codes, pie_chart_community_led
-from tabs_scripts.goals import goals  # Needed if you're working with CSV or Excel
-from tabs_scripts.key_progress_indicators import key_progress_indicators
-from tabs_scripts.line_chart import extract_district_line_chart, extract_micro_improvements, extract_state_line_chart
-from tabs_scripts.network_map_data import get_network_map_data
-from tabs_scripts.partners import get_partners
-from tabs_scripts.extract_state_details import update_district_view_indicators
-from tabs_scripts.pie_chart import pie_chart
-from tabs_scripts.testimonials import testimonials
-from tabs_scripts.programs import generate_program_reports
-from tabs_scripts.extract_district_details import extract_district_details
-from tabs_scripts.extract_community_details import extract_community_details
+from tabs_scripts import image_jobs, storage
+from tabs_scripts.pipeline import build_publish_stages, run_pipeline, summarize_run
+from tabs_scripts.workbook_context import WorkbookContext
 
 # Page setup
 st.set_page_config(page_title="File Upload App", page_icon=":page_facing_up:")
@@ -20,8 +11,37 @@ st.set_page_config(page_title="File Upload App", page_icon=":page_facing_up:")
 st.title("File Upload App")
 st.image("main_logo.svg", caption="Shikshagraha Dashboard", use_column_width=True)  # Make sure logo.png is in the same folder or provide correct path
 
+# Releases (hashed publish mode only)
+if storage.PUBLISH_MODE == storage.HASHED:
+    if st.sidebar.button("Roll back to previous release"):
+        try:
+            st.sidebar.success(f"Rolled back to release {storage.rollback_release()}")
+        except Exception as e:
+            st.sidebar.error(f"Rollback failed: {e}")
+        # The uploaded workbook survives reruns; stop here so it is not published over the rollback
+        st.stop()
+
+# Uploads a failed or interrupted run left in the publish journal
+outstanding = storage.outstanding_uploads()
+if outstanding and st.sidebar.button(f"Retry {outstanding} outstanding uploads"):
+    if storage.resume_uploads():
+        st.sidebar.success("All outstanding uploads completed")
+    else:
+        st.sidebar.error(f"{storage.outstanding_uploads()} uploads are still failing")
+
+# Image jobs a run could not finish
+outstanding_images = image_jobs.outstanding_image_jobs()
+if outstanding_images and st.sidebar.button(f"Retry {outstanding_images} outstanding images"):
+    image_jobs.resume_image_jobs()
+    if image_jobs.wait_for_image_jobs():
+        st.sidebar.success("All outstanding images published")
+    else:
+        st.sidebar.error(f"{image_jobs.outstanding_image_jobs()} images are still failing")
+
 # File uploader
 uploaded_file = st.file_uploader("Choose a file", type=["csv", "txt", "xlsx"])
+republish_all = st.checkbox("Republish tabs that have not changed since the last upload", value=False)
+publish_clicked = st.button("Publish", disabled=uploaded_file is None or not uploaded_file.name.endswith('.xlsx'))
 
 # 🔽 Step 5: Add the below block immediately after the file_uploader
 if uploaded_file is not None:
@@ -32,20 +52,36 @@ if uploaded_file is not None:
         if uploaded_file.name.endswith('.csv'):
             df = pd.read_csv(uploaded_file)
         elif uploaded_file.name.endswith('.xlsx'):
-            key_progress_indicators(uploaded_file) 
-            get_partners(uploaded_file)
-            get_network_map_data(uploaded_file)
-            update_district_view_indicators(uploaded_file)
-            extract_district_details(uploaded_file)
-            goals(uploaded_file)
-            pie_chart(uploaded_file)
-            testimonials(uploaded_file)
-            pie_chart_community_led(uploaded_file)
-            community_led_programs_sum_with_codes(uploaded_file)
-            generate_program_reports(uploaded_file)
-            extract_community_details(uploaded_file)
-            extract_micro_improvements(uploaded_file)
-            df = pd.read_excel(uploaded_file)
+            # Parse the workbook once and share it with every extractor
+            workbook_context = WorkbookContext(uploaded_file)
+            try:
+                # Streamlit keeps the file across reruns, so only publish when asked to
+                if publish_clicked:
+                    st.subheader("Publishing")
+                    stages = build_publish_stages()
+                    stage_rows = {stage.name: st.empty() for stage in stages}
+                    status_icons = {"pending": "⏳", "running": "🔄", "done": "✅", "skipped": "⏭️", "failed": "❌", "blocked": "⛔"}
+
+                    def show_stage_status(stage):
+                        elapsed = f" ({stage.elapsed:.1f}s)" if stage.elapsed is not None else ""
+                        error = f" — {stage.error}" if stage.error else ""
+                        stage_rows[stage.name].markdown(f"{status_icons[stage.status]} `{stage.name}` {stage.status}{elapsed}{error}")
+
+                    for stage in stages:
+                        show_stage_status(stage)
+                    run_pipeline(stages, workbook_context, on_status=show_stage_status, skip_unchanged=not republish_all)
+
+                    run_summary = summarize_run(stages)
+                    if run_summary.get("skipped"):
+                        st.info(f"Skipped (input sheets unchanged): {', '.join(run_summary['skipped'])}")
+                    if run_summary.get("failed") or run_summary.get("blocked"):
+                        st.error(f"Failed: {', '.join(run_summary.get('failed', []) + run_summary.get('blocked', []))}")
+
+                first_sheet = workbook_context.workbook.worksheets[0]
+                preview_rows = first_sheet.iter_rows(values_only=True)
+                df = pd.DataFrame(preview_rows, columns=next(preview_rows, None))
+            finally:
+                workbook_context.close()
         elif uploaded_file.name.endswith('.txt'):
             df = pd.read_csv(uploaded_file, delimiter="	")
         else:
@@ -1,7 +1,19 @@
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import storage
 from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
 import os
 import logging
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -22,46 +34,431 @@ service_account_info = {
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def upload_file_to_gcs_and_get_directory(bucket_name, source_file_path, destination_blob_name):
-    """
-    Uploads a file to a Google Cloud Storage bucket and returns the public URL for the folder.
+DEFAULT_MAX_CONNECTIONS = int(os.getenv("GCS_MAX_CONNECTIONS", "16"))
+DEFAULT_UPLOAD_WORKERS = int(os.getenv("GCS_UPLOAD_WORKERS", "8"))
+DEFAULT_UPLOAD_RETRIES = int(os.getenv("GCS_UPLOAD_RETRIES", "3"))
+# Objects at least this large go up as a chunked resumable upload, so a
+# dropped connection resends one chunk instead of the whole object
+RESUMABLE_MIN_BYTES = int(os.getenv("GCS_RESUMABLE_MIN_MB", "8")) * 1024 * 1024
+RESUMABLE_CHUNK_BYTES = int(os.getenv("GCS_RESUMABLE_CHUNK_MB", "4")) * 1024 * 1024
+RETRY_BASE_DELAY = float(os.getenv("GCS_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("GCS_RETRY_MAX_DELAY", "30"))
+
+# Text objects at least this large are stored gzip-compressed with
+# Content-Encoding: gzip; GCS decompresses them for clients that lack gzip.
+GZIP_ENABLED = os.getenv("GCS_GZIP", "1") != "0"
+GZIP_MIN_BYTES = int(os.getenv("GCS_GZIP_MIN_BYTES", "1024"))
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "image/svg+xml")
+
+# How objects become publicly readable:
+#   "acl"    (default) the upload itself sets the publicRead predefined ACL
+#   "bucket" the bucket grants allUsers read access (uniform bucket-level
+#            access); checked once per bucket instead of touching objects
+PUBLIC_ACCESS = os.getenv("GCS_PUBLIC_ACCESS", "acl").strip().lower()
+PUBLIC_READ_ROLES = ("roles/storage.objectViewer", "roles/storage.legacyObjectReader")
+
+# MD5 and Cache-Control of what we last uploaded (or found) per
+# "bucket/blob", so unchanged files skip both the upload and the metadata lookup
+REMOTE_MANIFEST_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", ".publish_cache", "remote_manifest.json"
+)
+_manifest_lock = threading.Lock()
+_manifest = {}
+_manifest_mtime = None
+# Records not written to disk yet; save_remote_manifest() writes them once per batch
+_unsaved = {}
+
+
+def bytes_md5(data):
+    """Base64 MD5 of bytes, in the same form GCS reports as md5_hash."""
+    return base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+
+
+def prepare_payload(source, destination_blob_name):
+    """Return (bytes to store, content type, content encoding) for an upload.
+
+    `source` is a local path or bytes. Compressible types above the size
+    threshold are gzipped with a fixed mtime, so the same content always
+    yields the same stored bytes (and MD5).
     """
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+    else:
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"Source file not found: {source}")
+        with open(source, "rb") as f:
+            data = f.read()
+
+    content_type = mimetypes.guess_type(destination_blob_name)[0] or "application/octet-stream"
+    compressible = content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES
+    if GZIP_ENABLED and compressible and len(data) >= GZIP_MIN_BYTES:
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data):
+            return compressed, content_type, "gzip"
+    return data, content_type, None
+
+
+def _read_manifest():
+    global _manifest, _manifest_mtime
     try:
-        if not os.path.exists(source_file_path):
-            logger.error(f"Source file not found: {source_file_path}")
-            return None
+        mtime = os.path.getmtime(REMOTE_MANIFEST_PATH)
+    except OSError:
+        _manifest, _manifest_mtime = {}, None
+        return _manifest
+    if mtime != _manifest_mtime:
+        try:
+            with open(REMOTE_MANIFEST_PATH, "r", encoding="utf-8") as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable remote manifest: {e}")
+            _manifest = {}
+        _manifest_mtime = mtime
+    return _manifest
+
+
+def cached_remote_md5(bucket_name, blob_name):
+    name = f"{bucket_name}/{blob_name}"
+    with _manifest_lock:
+        if name in _unsaved:
+            return _unsaved[name]
+        return _read_manifest().get(name)
+
+
+def record_remote_md5(bucket_name, blob_name, md5_hash):
+    """Remember an object's state in memory; it reaches disk with save_remote_manifest()."""
+    with _manifest_lock:
+        _unsaved[f"{bucket_name}/{blob_name}"] = md5_hash
 
-        # Initialize GCS client with service account credentials from environment variables
+
+def save_remote_manifest():
+    """Write the recorded object states to the manifest file in one go."""
+    global _manifest, _manifest_mtime
+    with _manifest_lock:
+        if not _unsaved:
+            return
+        manifest = dict(_read_manifest())
+        manifest.update(_unsaved)
+        os.makedirs(os.path.dirname(REMOTE_MANIFEST_PATH), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(REMOTE_MANIFEST_PATH), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, REMOTE_MANIFEST_PATH)
+        _manifest, _manifest_mtime = manifest, os.path.getmtime(REMOTE_MANIFEST_PATH)
+        _unsaved.clear()
+
+
+def backoff_delay(attempt):
+    """Seconds to wait before retry `attempt` (0-based): exponential with jitter, capped."""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+def public_folder_url(bucket_name, destination_blob_name):
+    folder_path = os.path.dirname(destination_blob_name)
+    return f"https://storage.googleapis.com/{bucket_name}/{folder_path}"
+
+
+class GCSUploader:
+    """Long-lived GCS uploader shared by every tab script.
+
+    Holds one credentials object and one storage client whose HTTP session
+    keeps a connection pool sized for concurrent uploads, so the token
+    exchange and TLS setup happen once per process instead of once per
+    file. Bucket handles are cached by name. Safe to use from several
+    threads.
+    """
+
+    def __init__(self, credentials_info=None, max_connections=DEFAULT_MAX_CONNECTIONS):
+        credentials_info = credentials_info or service_account_info
         logger.info("Initializing GCS client with service account credentials from environment variables")
-        credentials = service_account.Credentials.from_service_account_info(
-            service_account_info,
+        self.credentials = service_account.Credentials.from_service_account_info(
+            credentials_info,
             scopes=['https://www.googleapis.com/auth/cloud-platform']
         )
 
-        storage_client = storage.Client(credentials=credentials, project=service_account_info["project_id"])
-        bucket = storage_client.bucket(bucket_name)
+        session = AuthorizedSession(self.credentials)
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        self.client = storage.Client(
+            credentials=self.credentials,
+            project=credentials_info["project_id"],
+            _http=session
+        )
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._verified_buckets = set()
+
+        if PUBLIC_ACCESS not in ("acl", "bucket"):
+            raise ValueError(f"Unknown GCS_PUBLIC_ACCESS: {PUBLIC_ACCESS}")
+
+    def bucket(self, bucket_name):
+        with self._lock:
+            if bucket_name not in self._buckets:
+                self._buckets[bucket_name] = self.client.bucket(bucket_name)
+            return self._buckets[bucket_name]
+
+    def verify_public_bucket(self, bucket_name):
+        """In "bucket" mode, check once that allUsers may read the bucket's objects."""
+        with self._lock:
+            if PUBLIC_ACCESS != "bucket" or bucket_name in self._verified_buckets:
+                return
+        policy = self.bucket(bucket_name).get_iam_policy(requested_policy_version=3)
+        public = any(
+            binding["role"] in PUBLIC_READ_ROLES and "allUsers" in binding["members"]
+            for binding in policy.bindings
+        )
+        if not public:
+            raise RuntimeError(
+                f"Bucket {bucket_name} does not grant allUsers read access; "
+                f"grant roles/storage.objectViewer or set GCS_PUBLIC_ACCESS=acl"
+            )
+        logger.info(f"Bucket {bucket_name} is publicly readable")
+        with self._lock:
+            self._verified_buckets.add(bucket_name)
+
+    def flush_acls(self, bucket_name, pending, max_workers=DEFAULT_UPLOAD_WORKERS):
+        """Make the `pending` objects publish() adopted public; returns {blob name: error} of failures.
+
+        `pending` is the caller's own list, so concurrent batches never
+        flush or report each other's objects. Each object gets one PATCH
+        with predefinedAcl=publicRead, sent concurrently over the pooled
+        session (the ACL response cannot be read inside a batch). Objects
+        are recorded in the manifest only once they are public.
+        """
+        if not pending:
+            return {}
+        logger.info(f"Making {len(pending)} existing objects in {bucket_name} publicly accessible")
+        bucket = self.bucket(bucket_name)
+        failed = {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as pool:
+            futures = [
+                (pool.submit(bucket.blob(name).acl.save_predefined, "publicRead"), name, state)
+                for name, state in pending
+            ]
+            for future, name, state in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Failed to make {bucket_name}/{name} public: {e}")
+                    failed[name] = str(e)
+                    continue
+                record_remote_md5(bucket_name, name, state)
+        return failed
 
-        logger.info(f"Uploading {source_file_path} to {bucket_name}/{destination_blob_name}")
-        blob = bucket.blob(destination_blob_name)
-        blob.upload_from_filename(source_file_path)
+    def publish(self, bucket_name, source, destination_blob_name, cache_control=None, pending_acls=None):
+        """Upload `source` (a local path or bytes) to the bucket as a public object.
 
-        logger.info(f"Making file {destination_blob_name} publicly accessible")
-        blob.make_public()
+        Large text objects are stored gzip-encoded (see prepare_payload) and
+        `cache_control` becomes the object's Cache-Control header.
+        Returns False when the object already held the same bytes and nothing
+        was sent, True after an upload. Raises on failure. In acl mode an
+        existing object with the same bytes is appended to `pending_acls`
+        as (blob name, manifest state) for the caller's flush_acls(), or
+        made public right away when no list is given.
+        """
+        data, content_type, content_encoding = prepare_payload(source, destination_blob_name)
+        local_md5 = bytes_md5(data)
+        # The manifest tracks headers too, so a Cache-Control change re-uploads
+        local_state = f"{local_md5}|{cache_control or ''}"
 
-        folder_path = os.path.dirname(destination_blob_name)
-        if not folder_path:
-            folder_path = ""
+        known_md5 = cached_remote_md5(bucket_name, destination_blob_name)
+        if known_md5 == local_state:
+            logger.info(f"Skipping unchanged {bucket_name}/{destination_blob_name}")
+            return False
 
-        public_folder_url = f"https://storage.googleapis.com/{bucket_name}/{folder_path}"
-        logger.info(f"Generated public folder URL: {public_folder_url}")
+        self.verify_public_bucket(bucket_name)
+        bucket = self.bucket(bucket_name)
 
-        if blob.public_url:
-            logger.info(f"Public URL for file: {blob.public_url}")
-            return public_folder_url
-        else:
-            logger.error("File is not publicly accessible")
+        if known_md5 is None:
+            # Not in the manifest yet: compare against the object's metadata
+            existing = bucket.get_blob(destination_blob_name)
+            if (existing is not None and existing.md5_hash == local_md5
+                    and (existing.cache_control or None) == cache_control):
+                logger.info(f"Remote {bucket_name}/{destination_blob_name} already up to date")
+                if PUBLIC_ACCESS == "acl" and pending_acls is None:
+                    failed = self.flush_acls(bucket_name, [(destination_blob_name, local_state)])
+                    if failed:
+                        raise RuntimeError(failed[destination_blob_name])
+                elif PUBLIC_ACCESS == "acl":
+                    pending_acls.append((destination_blob_name, local_state))
+                else:
+                    record_remote_md5(bucket_name, destination_blob_name, local_state)
+                return False
+
+        chunk_size = RESUMABLE_CHUNK_BYTES if len(data) >= RESUMABLE_MIN_BYTES else None
+        blob = bucket.blob(destination_blob_name, chunk_size=chunk_size)
+        blob.content_encoding = content_encoding
+        blob.cache_control = cache_control
+        logger.info(
+            f"Uploading {len(data)} bytes{' (gzip)' if content_encoding else ''} "
+            f"to {bucket_name}/{destination_blob_name}"
+        )
+        # Public at upload time: no separate ACL request per object
+        blob.upload_from_string(
+            data,
+            content_type=content_type,
+            predefined_acl="publicRead" if PUBLIC_ACCESS == "acl" else None
+        )
+        logger.info(f"Public URL for file: {blob.public_url}")
+        record_remote_md5(bucket_name, destination_blob_name, local_state)
+        return True
+
+    def put(self, bucket_name, source, destination_blob_name, cache_control=None):
+        """publish() a single object, make it public if it was adopted, and save the manifest.
+
+        Returns what publish() returns. Raises on failure.
+        """
+        pending_acls = []
+        try:
+            uploaded = self.publish(bucket_name, source, destination_blob_name, cache_control, pending_acls)
+            failed = self.flush_acls(bucket_name, pending_acls)
+            if destination_blob_name in failed:
+                raise RuntimeError(failed[destination_blob_name])
+            return uploaded
+        finally:
+            save_remote_manifest()
+
+    def upload_file(self, bucket_name, source_file_path, destination_blob_name):
+        """Upload a file unless the object already holds the same bytes.
+
+        Returns the public URL of the object's folder, or None on failure.
+        """
+        try:
+            self.put(bucket_name, source_file_path, destination_blob_name)
+            folder_url = public_folder_url(bucket_name, destination_blob_name)
+            logger.info(f"Generated public folder URL: {folder_url}")
+            return folder_url
+        except Exception as e:
+            logger.error(f"Failed to upload file or generate public URL: {str(e)}")
             return None
 
+    def read(self, bucket_name, blob_name):
+        """Return the (decoded) bytes of an object, or None if it does not exist."""
+        blob = self.bucket(bucket_name).get_blob(blob_name)
+        if blob is None:
+            return None
+        data = blob.download_as_bytes()
+        if data[:2] == b"\x1f\x8b":
+            data = gzip.decompress(data)
+        return data
+
+    def upload_many(self, bucket_name, items, max_workers=DEFAULT_UPLOAD_WORKERS, retries=DEFAULT_UPLOAD_RETRIES,
+                    cache_control=None):
+        """Upload (source, destination_blob_name) pairs concurrently.
+
+        Each source is a local path or bytes, and every object gets
+        `cache_control`. Failed files are retried up to
+        `retries` times with exponential backoff (see backoff_delay); one
+        failure never stops the rest of the batch. Returns a BulkUploadResult.
+        """
+        items = list(items)
+        result = BulkUploadResult(bucket_name)
+        if not items:
+            return result
+        # Objects of this batch only; list.append is atomic across the pool
+        pending_acls = []
+
+        def run(item):
+            source, destination_blob_name = item
+            for attempt in range(retries + 1):
+                try:
+                    uploaded = self.publish(bucket_name, source, destination_blob_name, cache_control, pending_acls)
+                    return destination_blob_name, uploaded, None
+                except FileNotFoundError as e:
+                    return destination_blob_name, None, e
+                except Exception as e:
+                    if attempt == retries:
+                        return destination_blob_name, None, e
+                    logger.warning(f"Retrying {destination_blob_name} after error: {e}")
+                    time.sleep(backoff_delay(attempt))
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+                for destination_blob_name, uploaded, error in pool.map(run, items):
+                    if error is not None:
+                        logger.error(f"Failed to upload {destination_blob_name}: {error}")
+                        result.failed[destination_blob_name] = str(error)
+                    elif uploaded:
+                        result.uploaded.append(destination_blob_name)
+                    else:
+                        result.skipped.append(destination_blob_name)
+
+            # Existing objects that could not be made public count as failed
+            failed_acls = self.flush_acls(bucket_name, pending_acls, max_workers=max_workers)
+            result.failed.update(failed_acls)
+            result.skipped = [name for name in result.skipped if name not in failed_acls]
+        finally:
+            # One manifest write per batch, even when some uploads failed
+            save_remote_manifest()
+        return result
+
+
+class BulkUploadResult:
+    """Outcome of GCSUploader.upload_many, keyed by destination blob name."""
+
+    def __init__(self, bucket_name):
+        self.bucket_name = bucket_name
+        self.uploaded = []
+        self.skipped = []
+        self.failed = {}
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    def succeeded(self, destination_blob_name):
+        return destination_blob_name not in self.failed
+
+    def folder_url(self, destination_blob_name):
+        return public_folder_url(self.bucket_name, destination_blob_name)
+
+    def __repr__(self):
+        return (f"BulkUploadResult(uploaded={len(self.uploaded)}, "
+                f"skipped={len(self.skipped)}, failed={len(self.failed)})")
+
+
+_uploader = None
+_uploader_lock = threading.Lock()
+
+
+def get_uploader():
+    """Return the process-wide GCSUploader, creating it on first use."""
+    global _uploader
+    with _uploader_lock:
+        if _uploader is None:
+            _uploader = GCSUploader()
+        return _uploader
+
+
+def upload_file_to_gcs_and_get_directory(bucket_name, source_file_path, destination_blob_name):
+    """
+    Uploads a file to a Google Cloud Storage bucket and returns the public URL for the folder.
+    The upload is skipped when the object already holds the same bytes.
+    """
+    try:
+        uploader = get_uploader()
+    except Exception as e:
+        logger.error(f"Failed to initialize GCS client: {str(e)}")
+        return None
+    return uploader.upload_file(bucket_name, source_file_path, destination_blob_name)
+
+
+def upload_many(bucket_name, items, max_workers=DEFAULT_UPLOAD_WORKERS, retries=DEFAULT_UPLOAD_RETRIES,
+                cache_control=None):
+    """Upload (local path or bytes, destination blob name) pairs concurrently.
+
+    Returns a BulkUploadResult; if the client cannot be created every item
+    is reported as failed.
+    """
+    items = list(items)
+    try:
+        uploader = get_uploader()
     except Exception as e:
-        logger.error(f"Failed to upload file or generate public URL: {str(e)}")
-        return None
\ No newline at end of file
+        logger.error(f"Failed to initialize GCS client: {str(e)}")
+        result = BulkUploadResult(bucket_name)
+        result.failed = {destination_blob_name: str(e) for _, destination_blob_name in items}
+        return result
+    return uploader.upload_many(bucket_name, items, max_workers=max_workers, retries=retries,
+                                cache_control=cache_control)
@@ -9,7 +9,8 @@ PAGE_METADATA = {
     "TESTIMONIALS":"Testimonials",
     "PROGRAMS":"Programs",
     "COMMUNITY_LED_PROGRAMS":"Community Led Programs",
-    "DISTRICT_DETAILS": "District Details"
+    "DISTRICT_DETAILS": "District Details",
+    "MICRO_IMPROVEMENTS": "Micro improvements progress"
 }
 
 TABS_METADATA = {
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+
+from tabs_scripts import storage
+from tabs_scripts.fingerprints import GroupFingerprints
+
+BUNDLE_FILENAME = "bundle.json"
+ENTITY_KINDS = ("states", "districts")
+
+
+def collect_bundle_sections(folder):
+    """Return {file stem: raw bytes} for the published JSON files in an entity folder."""
+    sections = {}
+    for fname in sorted(os.listdir(folder)):
+        if not fname.endswith(".json") or fname == BUNDLE_FILENAME:
+            continue
+        with open(os.path.join(folder, fname), "rb") as f:
+            sections[fname[:-len(".json")]] = f.read()
+    return sections
+
+
+def build_bundles(excel_file=None):
+    """Publish states/{id}/bundle.json and districts/{id}/bundle.json.
+
+    A bundle holds every other JSON file of the entity (metrics, pie-chart,
+    map, line-chart, community and program files) under its file name
+    without the extension, so a page needs one request instead of eight.
+    Sections are read from the local copies the extractors keep in states/
+    and districts/; only bundles whose files changed since the last run are
+    uploaded again.
+    """
+    if not storage.MIRROR_ENABLED:
+        print("⚠️ LOCAL_MIRROR is off; bundles need the local copies of the entity files")
+        return
+
+    # Extractors write their per-entity copies in the background
+    if storage.flush_mirror():
+        return False
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    fingerprints = GroupFingerprints("bundles")
+    pending = {}
+    for kind in ENTITY_KINDS:
+        base_dir = os.path.join(script_dir, "..", kind)
+        if not os.path.isdir(base_dir):
+            continue
+        for entity_id in sorted(os.listdir(base_dir)):
+            folder = os.path.join(base_dir, entity_id)
+            if not os.path.isdir(folder):
+                continue
+            sections = collect_bundle_sections(folder)
+            if not sections:
+                continue
+            key = f"{kind}/{entity_id}/{BUNDLE_FILENAME}"
+            for name, data in sections.items():
+                fingerprints.add(key, [name, hashlib.sha256(data).hexdigest()])
+            if fingerprints.changed(key):
+                pending[key] = {name: json.loads(data) for name, data in sections.items()}
+
+    if not pending:
+        print("✅ All bundles are up to date")
+        return
+
+    result = storage.upload_many((storage.render_json(bundle), key) for key, bundle in pending.items())
+    for key in pending:
+        if result.succeeded(key):
+            fingerprints.mark_published(key)
+    fingerprints.save()
+    print(f"✅ Published {len(pending) - len(result.failed)} of {len(pending)} bundles")
+    return result.ok
@@ -1,9 +1,9 @@
-import openpyxl
 import json
 import os
-import importlib.util
 
 from constants import PAGE_METADATA, TABS_METADATA
+from tabs_scripts.workbook_context import as_workbook_context
+from tabs_scripts import storage
 
 def pie_chart_community_led(excel_file):
     try:
@@ -14,7 +14,7 @@ def pie_chart_community_led(excel_file):
         json_path = os.path.join(script_dir, "..", "pages", "community-led-improvements-page.json")
 
         # Open the Excel file
-        workbook = openpyxl.load_workbook(excel_file, data_only=True)
+        workbook = as_workbook_context(excel_file).workbook
         try:
             sheet = workbook["Community Led Programs"]
         except KeyError:
@@ -102,25 +102,21 @@ def pie_chart_community_led(excel_file):
         with open(json_path, 'w', encoding='utf-8') as json_file:
             json.dump(json_data, json_file, indent=2, ensure_ascii=False)
 
-        # Dynamically import gcp_access module and upload file
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
-
-        folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-            bucket_name=os.environ.get("BUCKET_NAME"),
+        # Upload file
+        folder_url = storage.upload_file(
             source_file_path=json_path,
-            destination_blob_name="sg-dashboard/community-led-improvements-page.json"
+            key="community-led-improvements-page.json"
         )
 
         if folder_url:
             print(f"Successfully uploaded and got public folder URL: {folder_url}")
         else:
             print("Failed to upload file to GCS. Check logs for details.")
+            return False
 
     except Exception as e:
         print(f"Error: {str(e)}")
+        return False
 
 def community_led_programs_sum_with_codes(excel_file):
     try:
@@ -131,7 +127,7 @@ def community_led_programs_sum_with_codes(excel_file):
         json_path = os.path.join(script_dir, "..", "pages", "community-country-view.json")
 
         # Open the Excel file
-        workbook = openpyxl.load_workbook(excel_file, data_only=True)
+        workbook = as_workbook_context(excel_file).workbook
 
         # Load "Community Led Programs" sheet
         try:
@@ -273,16 +269,10 @@ def community_led_programs_sum_with_codes(excel_file):
         with open(json_path, 'w', encoding='utf-8') as json_file:
             json.dump(json_data, json_file, indent=2, ensure_ascii=False)
 
-        # Dynamically import gcp_access module and upload file
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
-
-        folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-            bucket_name=os.environ.get("BUCKET_NAME"),
+        # Upload file
+        folder_url = storage.upload_file(
             source_file_path=json_path,
-            destination_blob_name="sg-dashboard/community-country-view.json"
+            key="community-country-view.json"
         )
 
         if folder_url:
@@ -290,9 +280,11 @@ def community_led_programs_sum_with_codes(excel_file):
             updateOverviewValues()
         else:
             print("Failed to upload file to GCS. Check logs for details.")
+            return False
 
     except Exception as e:
         print(f"Error: {str(e)}")
+        return False
 
 def updateOverviewValues():
     # Get the directory of the script
@@ -376,14 +368,9 @@ def updateOverviewValues():
     try:
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(data, f, indent=2)
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
-        folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-            bucket_name=os.environ.get("BUCKET_NAME"),
+        folder_url = storage.upload_file(
             source_file_path=json_path,
-            destination_blob_name="sg-dashboard/community-country-view.json"
+            key="community-country-view.json"
         )
         print(f"Updated JSON saved to {output_path}")
     except Exception as e:
@@ -0,0 +1,215 @@
+import io
+import os
+import threading
+import time
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+from googleapiclient.http import MediaIoBaseDownload
+from dotenv import load_dotenv
+
+from tabs_scripts.fingerprints import CACHE_DIR, load_json_state, save_json_state
+
+load_dotenv()
+
+SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+
+_credentials = None
+_credentials_lock = threading.Lock()
+
+
+def get_credentials():
+    """Service account credentials from the environment, built on first use.
+
+    Importing this module needs no credentials, so runs that never touch
+    Drive (e.g. a local render) work without PRIVATE_KEY.
+    """
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            service_account_info = {
+                "type": os.getenv("TYPE"),
+                "project_id": os.getenv("PROJECT_ID"),
+                "private_key_id": os.getenv("PRIVATE_KEY_ID"),
+                "private_key": (os.getenv("PRIVATE_KEY") or "").replace('\\n', '\n'),
+                "client_email": os.getenv("CLIENT_EMAIL"),
+                "auth_uri": os.getenv("AUTH_URI"),
+                "token_uri": os.getenv("TOKEN_URI"),
+                "auth_provider_x509_cert_url": os.getenv("AUTH_PROVIDER_X509_CERT_URL"),
+                "client_x509_cert_url": os.getenv("CLIENT_X509_CERT_URL"),
+                "universe_domain": os.getenv("UNIVERSE_DOMAIN"),
+            }
+            _credentials = service_account.Credentials.from_service_account_info(
+                service_account_info, scopes=SCOPES
+            )
+        return _credentials
+
+
+# Metadata requested for every file we may download
+FILE_FIELDS = "id, name, mimeType, size, md5Checksum, modifiedTime"
+# Drive accepts at most 100 calls per batch request
+BATCH_SIZE = 100
+# Files are fetched in chunks of this size, and larger ones are skipped
+DOWNLOAD_CHUNK_BYTES = int(os.environ.get("DRIVE_CHUNK_MB", "4")) * 1024 * 1024
+MAX_PICTURE_BYTES = int(os.environ.get("MAX_PICTURE_MB", "25")) * 1024 * 1024
+
+FOLDER_LISTINGS_PATH = os.path.join(CACHE_DIR, "drive_listings.json")
+LISTING_CACHE_ENABLED = os.environ.get("DRIVE_LISTING_CACHE", "1") != "0"
+# Listings are re-read after this long even if no change was reported
+LISTING_MAX_AGE = float(os.environ.get("DRIVE_LISTING_MAX_AGE_HOURS", "24")) * 3600
+
+_local = threading.local()
+
+
+def get_drive_service():
+    """Drive client for the calling thread; its httplib2 connection is not thread-safe."""
+    if not hasattr(_local, "service"):
+        _local.service = build('drive', 'v3', credentials=get_credentials(), cache_discovery=False)
+    return _local.service
+
+
+def file_version(metadata):
+    """Identify a file's content: its md5Checksum, else its modifiedTime (None if neither)."""
+    return metadata.get('md5Checksum') or metadata.get('modifiedTime')
+
+
+def get_files_metadata(file_ids):
+    """Return {file_id: metadata (FILE_FIELDS)} for Drive files, with None where it is unavailable.
+
+    The files().get calls go through the batch endpoint, up to BATCH_SIZE
+    per HTTP request.
+    """
+    file_ids = list(dict.fromkeys(file_ids))
+    metadata = {file_id: None for file_id in file_ids}
+
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            print(f"⚠️ No Drive metadata for {request_id}: {exception}")
+        else:
+            metadata[request_id] = response
+
+    if not file_ids:
+        return metadata
+    try:
+        service = get_drive_service()
+    except Exception as e:
+        print(f"⚠️ Drive client unavailable, no metadata for {len(file_ids)} files: {e}")
+        return metadata
+    for start in range(0, len(file_ids), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=on_response)
+        for file_id in file_ids[start:start + BATCH_SIZE]:
+            batch.add(
+                service.files().get(fileId=file_id, fields=FILE_FIELDS, supportsAllDrives=True),
+                request_id=file_id
+            )
+        try:
+            batch.execute()
+        except Exception as e:
+            print(f"⚠️ Drive metadata batch failed: {e}")
+    return metadata
+
+
+def download_file(file_id):
+    """Download a Drive file into memory; returns its bytes or None.
+
+    The file arrives in DOWNLOAD_CHUNK_BYTES requests and the download is
+    abandoned once it passes MAX_PICTURE_BYTES.
+    """
+    try:
+        request = get_drive_service().files().get_media(fileId=file_id)
+        buffer = io.BytesIO()
+        downloader = MediaIoBaseDownload(buffer, request, chunksize=DOWNLOAD_CHUNK_BYTES)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk()
+            if buffer.tell() > MAX_PICTURE_BYTES:
+                print(f"⚠️ Skipping file {file_id}: larger than {MAX_PICTURE_BYTES} bytes")
+                return None
+        return buffer.getvalue()
+    except Exception as e:
+        print(f"❌ Failed to download file {file_id}: {e}")
+        return None
+
+
+def list_folder_images(folder_id):
+    """Return the metadata (FILE_FIELDS) of every image directly inside a Drive folder."""
+    files = []
+    page_token = None
+    while True:
+        response = get_drive_service().files().list(
+            q=f"'{folder_id}' in parents and mimeType contains 'image/' and trashed = false",
+            spaces='drive',
+            fields=f'nextPageToken, files({FILE_FIELDS})',
+            pageSize=1000,
+            pageToken=page_token
+        ).execute()
+        files.extend(response.get('files', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return files
+
+
+class FolderListings:
+    """Folder image listings kept between runs, invalidated through the Drive changes feed.
+
+    On creation, the changes reported since the previous run are read (one
+    request when nothing changed). A folder's cached listing is dropped when
+    a change touches the folder or one of its files, or when it is older
+    than LISTING_MAX_AGE, which also covers files the changes feed does not
+    report. Call save() once the run's listings are used.
+    """
+
+    def __init__(self, path=FOLDER_LISTINGS_PATH):
+        self.path = path
+        state = load_json_state(path, {}) if LISTING_CACHE_ENABLED else {}
+        self.folders = state.get("folders", {})
+        self.page_token = state.get("page_token")
+        self._sync()
+
+    def _sync(self):
+        if not LISTING_CACHE_ENABLED:
+            return
+        service = get_drive_service()
+        try:
+            if not self.page_token:
+                # Without a starting point nothing cached can be trusted
+                self.folders = {}
+                self.page_token = service.changes().getStartPageToken().execute()["startPageToken"]
+                return
+
+            changed = set()
+            page_token = self.page_token
+            while page_token:
+                response = service.changes().list(
+                    pageToken=page_token,
+                    spaces='drive',
+                    pageSize=1000,
+                    fields="nextPageToken, newStartPageToken, changes(fileId, file(parents))"
+                ).execute()
+                for change in response.get("changes", []):
+                    changed.add(change.get("fileId"))
+                    changed.update((change.get("file") or {}).get("parents", []))
+                page_token = response.get("nextPageToken")
+                if "newStartPageToken" in response:
+                    self.page_token = response["newStartPageToken"]
+        except Exception as e:
+            print(f"⚠️ Could not read Drive changes, re-listing folders: {e}")
+            self.folders, self.page_token = {}, None
+            return
+
+        now = time.time()
+        for folder_id, listing in list(self.folders.items()):
+            stale = now - listing.get("listed_at", 0) > LISTING_MAX_AGE
+            if stale or folder_id in changed or any(file["id"] in changed for file in listing["files"]):
+                del self.folders[folder_id]
+
+    def images(self, folder_id):
+        """Return the folder's image metadata, from cache when it has not changed."""
+        listing = self.folders.get(folder_id)
+        if listing is None:
+            listing = {"files": list_folder_images(folder_id), "listed_at": time.time()}
+            self.folders[folder_id] = listing
+        return listing["files"]
+
+    def save(self):
+        if LISTING_CACHE_ENABLED:
+            save_json_state(self.path, {"folders": self.folders, "page_token": self.page_token})
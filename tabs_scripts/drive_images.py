@@ -0,0 +1,135 @@
+import os
+import re
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from tabs_scripts import storage
+from tabs_scripts.image_cache import get_image_cache
+from tabs_scripts.image_optimizer import image_renditions, profile_tag
+
+DRIVE_DOWNLOAD_URL = "https://drive.google.com/uc?export=download&id={file_id}"
+DEFAULT_FETCH_WORKERS = int(os.environ.get("IMAGE_FETCH_WORKERS", "8"))
+DEFAULT_FETCH_RETRIES = int(os.environ.get("IMAGE_FETCH_RETRIES", "3"))
+# (connect, read) timeouts in seconds
+FETCH_TIMEOUT = (5, float(os.environ.get("IMAGE_FETCH_TIMEOUT", "30")))
+# Folder every Drive image is published under, named after its content
+IMAGES_PREFIX = "images"
+
+
+def drive_file_id(link):
+    """Return the file ID of a Drive share link ("/d/<id>" or "id=<id>"), or ''."""
+    if not isinstance(link, str):
+        return ''
+    match = re.search(r"/d/([a-zA-Z0-9_-]+)", link) or re.search(r"id=([a-zA-Z0-9_-]+)", link)
+    return match.group(1) if match else ''
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide Drive download session.
+
+    Its connection pool is sized for DEFAULT_FETCH_WORKERS concurrent
+    downloads, and connection errors and 429/5xx responses are retried
+    with exponential backoff.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=DEFAULT_FETCH_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(["GET"]),
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(
+                pool_connections=DEFAULT_FETCH_WORKERS,
+                pool_maxsize=DEFAULT_FETCH_WORKERS,
+                max_retries=retry
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def fetch_image(file_id):
+    """Download a publicly shared Drive file; returns its bytes or None."""
+    url = DRIVE_DOWNLOAD_URL.format(file_id=file_id)
+    try:
+        response = get_session().get(url, timeout=FETCH_TIMEOUT)
+        if response.status_code == 200:
+            print(f"✅ Downloaded image for file ID {file_id}")
+            return response.content
+        print(f"❌ Failed to download image for file ID {file_id}: HTTP {response.status_code}")
+    except requests.RequestException as e:
+        print(f"❌ Exception downloading image {file_id}: {e}")
+    return None
+
+
+def publish_images(images, key_prefix, profile):
+    """Optimize downloaded images and publish their renditions in one batch.
+
+    `images` are (image id, version, bytes, filename, extension) tuples,
+    the image id being what the image cache knows the bytes by (see
+    image_id) and `extension` the rendition_extension planned for the
+    image, or sniffed from its bytes when its MIME type was unknown; see
+    image_renditions for what is published per image. Versions
+    that are published are recorded in the image cache. Returns
+    {filename: {rendition: URL}} for the images whose renditions all
+    uploaded.
+    """
+    cache = get_image_cache()
+    uploads = {}
+    renditions_by_file = {}
+    for file_id, version, content, filename, extension in images:
+        renditions = image_renditions(content, filename, profile, extension)
+        if renditions is None:
+            print(f"⚠️ Skipping {filename}: not a {extension} image")
+            continue
+        keys = {}
+        for name, (rendition_filename, data) in renditions.items():
+            key = f"{key_prefix}/{rendition_filename}"
+            uploads[key] = data
+            keys[name] = (key, rendition_filename)
+        renditions_by_file[filename] = (file_id, version, keys)
+
+    result = storage.upload_many((data, key) for key, data in uploads.items())
+    urls = {}
+    for filename, (file_id, version, keys) in renditions_by_file.items():
+        if not all(result.succeeded(key) for key, _ in keys.values()):
+            print(f"Failed to upload {filename}. Check logs for details.")
+            continue
+        urls[filename] = {
+            name: f"{result.folder_url(key).rstrip('/')}/{rendition_filename}"
+            for name, (key, rendition_filename) in keys.items()
+        }
+        if version:
+            cache.record(file_id, version, cache_target(key_prefix, filename, profile), urls[filename])
+        print(f"Successfully uploaded and got public URL: {urls[filename]['src']}")
+    cache.save()
+    return urls
+
+
+def cache_target(key_prefix, filename, profile):
+    return f"{key_prefix}/{filename}#{profile_tag(profile)}"
+
+
+def image_id(file_id, metadata):
+    """Name a Drive file's image is published and cached under.
+
+    It is the MD5 of the file's bytes as Drive reports it, so every row,
+    tab or Drive file holding the same bytes shares one set of objects and
+    different images never share a name. Without metadata the bytes are
+    unknown until downloaded, and the file ID is used instead.
+    """
+    md5 = metadata and metadata.get("md5Checksum")
+    return md5 if md5 else f"drive-{file_id}"
+
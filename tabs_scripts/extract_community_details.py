@@ -1,8 +1,9 @@
-import openpyxl
 import json
 import os
-import importlib.util
 from constants import PAGE_METADATA, TABS_METADATA
+from tabs_scripts.workbook_context import as_workbook_context
+from tabs_scripts.fingerprints import GroupFingerprints
+from tabs_scripts import storage
 
 def load_state_codes():
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,8 +16,6 @@ def load_state_codes():
 
 import os
 import json
-import openpyxl
-import importlib.util
 
 def extract_community_details(excel_file):
     try:
@@ -25,7 +24,7 @@ def extract_community_details(excel_file):
         if not state_codes:
             return
 
-        workbook = openpyxl.load_workbook(excel_file, data_only=True)
+        workbook = as_workbook_context(excel_file).workbook
 
         try:
             sheet = workbook[PAGE_METADATA["COMMUNITY_LED_PROGRAMS"]]
@@ -78,13 +77,13 @@ def extract_community_details(excel_file):
         }
 
         state_data = {}
+        district_outputs = {}
 
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
+        # Row hashes per state/district, so only changed entities are rebuilt
+        row_groups = GroupFingerprints("community_details")
 
-        for row in sheet.iter_rows(min_row=2, values_only=True):
+        # max_col pads every row out to the last column looked up below
+        for row in sheet.iter_rows(min_row=2, max_col=max(column_indices.values()), values_only=True):
             state_name = str(row[column_indices["Name of the State"] - 1]).strip()
             district_name = str(row[column_indices["Name of the District"] - 1]).strip()
 
@@ -100,6 +99,10 @@ def extract_community_details(excel_file):
                 print(f"⚠️ Skipping unknown district {district_name} under state {state_name}")
                 continue
 
+            row_values = [row[column_indices[h] - 1] for h in expected_headers]
+            row_groups.add(f"states/{state_id}", [district_id] + row_values)
+            row_groups.add(f"districts/{district_id}", row_values)
+
             if state_id not in state_data:
                 state_data[state_id] = {
                     "state_name": state_name,
@@ -126,9 +129,6 @@ def extract_community_details(excel_file):
                 state_data[state_id]["pie_totals"][k] += val
                 pie_totals[k] = val
 
-            district_folder = os.path.join(script_dir, "..", "districts", district_id)
-            os.makedirs(district_folder, exist_ok=True)
-
             metrics_json = {
                 "metrics": [
                     {
@@ -139,9 +139,6 @@ def extract_community_details(excel_file):
                     for idx, k in enumerate(map_keys, start=1)
                 ]
             }
-            metrics_path = os.path.join(district_folder, "community-metrics.json")
-            with open(metrics_path, "w", encoding="utf-8") as f:
-                json.dump(metrics_json, f, indent=2, ensure_ascii=False)
 
             pie_json = {
                 "data": [
@@ -149,26 +146,34 @@ def extract_community_details(excel_file):
                      for k in pie_keys
                 ]
             }
-            pie_path = os.path.join(district_folder, "community-pie-chart.json")
-            with open(pie_path, "w", encoding="utf-8") as f:
-                json.dump(pie_json, f, indent=2, ensure_ascii=False)
-
-            for fname in ["community-metrics.json", "community-pie-chart.json"]:
-                local_path = os.path.join(district_folder, fname)
-                blob_path = f"sg-dashboard/districts/{district_id}/{fname}"
-                folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-                    bucket_name=os.environ.get("BUCKET_NAME"),
-                    source_file_path=local_path,
-                    destination_blob_name=blob_path
-                )
-                if folder_url:
-                    print(f"✅ Uploaded {fname} for district {district_name} ({district_id}) to {folder_url}")
-                else:
-                    print(f"❌ Failed to upload {fname} for district {district_name} ({district_id})")
 
-        for state_id, data in state_data.items():
+            # A district listed twice keeps its last row, as before
+            district_outputs[district_id] = (district_name, metrics_json, pie_json)
+
+        changed_states = [state_id for state_id in state_data if row_groups.changed(f"states/{state_id}")]
+        changed_districts = [dist_id for dist_id in district_outputs if row_groups.changed(f"districts/{dist_id}")]
+        print(f"ℹ️ Rebuilding {len(changed_states)}/{len(state_data)} states and "
+              f"{len(changed_districts)}/{len(district_outputs)} districts with changed rows")
+
+        # Files to publish, grouped by the row group they belong to
+        group_uploads = {}
+
+        for district_id in changed_districts:
+            district_name, metrics_json, pie_json = district_outputs[district_id]
+            district_folder = os.path.join(script_dir, "..", "districts", district_id)
+            rendered = {
+                "community-metrics.json": storage.render_json(metrics_json),
+                "community-pie-chart.json": storage.render_json(pie_json),
+            }
+            for fname, content in rendered.items():
+                storage.mirror_file(os.path.join(district_folder, fname), content)
+            group_uploads[f"districts/{district_id}"] = [
+                (content, f"districts/{district_id}/{fname}") for fname, content in rendered.items()
+            ]
+
+        for state_id in changed_states:
+            data = state_data[state_id]
             state_folder = os.path.join(script_dir, "..", "states", state_id)
-            os.makedirs(state_folder, exist_ok=True)
 
             map_json = {
                 "result": {
@@ -181,10 +186,6 @@ def extract_community_details(excel_file):
                 }
             }
 
-            map_path = os.path.join(state_folder, "community-map.json")
-            with open(map_path, "w", encoding="utf-8") as f:
-                json.dump(map_json, f, indent=2, ensure_ascii=False)
-
             # Build community-pie-chart.json
             # pie_json = {
             #     "data": [{"name": k.strip(), "value": v} for k, v in data["pie_totals"].items()]
@@ -195,37 +196,49 @@ def extract_community_details(excel_file):
                     for k, v in data["pie_totals"].items()
                 ]
             }
-            pie_path = os.path.join(state_folder, "community-pie-chart.json")
-            with open(pie_path, "w", encoding="utf-8") as f:
-                json.dump(pie_json, f, indent=2, ensure_ascii=False)
-
-            for fname in ["community-map.json", "community-pie-chart.json"]:
-                local_path = os.path.join(state_folder, fname)
-                blob_path = f"sg-dashboard/states/{state_id}/{fname}"
-                folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-                    bucket_name=os.environ.get("BUCKET_NAME"),
-                    source_file_path=local_path,
-                    destination_blob_name=blob_path
-                )
-                if folder_url:
-                    print(f"✅ Uploaded {fname} for state {data['state_name']} to {folder_url}")
+            rendered = {
+                "community-map.json": storage.render_json(map_json),
+                "community-pie-chart.json": storage.render_json(pie_json),
+            }
+            for fname, content in rendered.items():
+                storage.mirror_file(os.path.join(state_folder, fname), content)
+            group_uploads[f"states/{state_id}"] = [
+                (content, f"states/{state_id}/{fname}") for fname, content in rendered.items()
+            ]
+
+        result = storage.upload_many(
+            [item for items in group_uploads.values() for item in items]
+        )
+
+        for group_key, items in group_uploads.items():
+            for _, key in items:
+                if result.succeeded(key):
+                    print(f"✅ Uploaded {key} to {result.folder_url(key)}")
                 else:
-                    print(f"❌ Failed to upload {fname} for state {data['state_name']}")
+                    print(f"❌ Failed to upload {key}: {result.failed[key]}")
+            if all(result.succeeded(key) for _, key in items):
+                row_groups.mark_published(group_key)
+
+        row_groups.save()
 
         state_details_path = os.path.join(script_dir, "..", "pages", "community-details-page.json")
-        folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-            bucket_name=os.environ.get("BUCKET_NAME"),
+        folder_url = storage.upload_file(
             source_file_path=state_details_path,
-            destination_blob_name="sg-dashboard/community-details-page.json"
+            key="community-details-page.json"
         )
 
+        published = result.ok
         if folder_url:
             print(f"✅ Uploaded community-details-page.json to {folder_url}")
         else:
+            published = False
             print("❌ Failed to upload community-details-page.json")
 
+        return published
+
     except Exception as e:
         print(f"❌ Error: {str(e)}")
+        return False
 
 if __name__ == "__main__":
     import sys
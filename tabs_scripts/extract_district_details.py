@@ -1,8 +1,10 @@
-import openpyxl
 import json
 import os
-import importlib.util
 from constants import PAGE_METADATA, TABS_METADATA
+from tabs_scripts.workbook_context import as_workbook_context
+from tabs_scripts.sheet_reader import iter_projected_rows, read_headers, resolve_columns
+from tabs_scripts.fingerprints import GroupFingerprints
+from tabs_scripts import storage
 
 def load_state_codes():
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -29,7 +31,7 @@ def extract_district_details(excel_file):
         if not state_codes:
             return
 
-        workbook = openpyxl.load_workbook(excel_file, data_only=True)
+        workbook = as_workbook_context(excel_file).workbook
 
         try:
             sheet = workbook[PAGE_METADATA["DISTRICT_DETAILS"]]
@@ -38,12 +40,7 @@ def extract_district_details(excel_file):
             return
 
         expected_headers = TABS_METADATA["DISTRICT_DETAILS"]
-        column_indices = {}
-        for cell in sheet[1]:
-            if cell.value and str(cell.value).strip() in expected_headers:
-                column_indices[str(cell.value).strip()] = cell.column
-
-        missing_columns = [col for col in expected_headers if col not in column_indices]
+        column_indices, missing_columns = resolve_columns(read_headers(sheet), expected_headers)
         if missing_columns:
             print(f"❌ Missing required columns: {missing_columns}")
             return
@@ -58,16 +55,17 @@ def extract_district_details(excel_file):
         # ✅ District-level containers
         district_files_map = {}
 
-        row_num = 2
-        while True:
-            state_name = sheet.cell(row=row_num, column=column_indices["State Name"]).value
-            if not state_name:
-                break
+        # Row hashes per state/district, so only changed entities are rebuilt
+        row_groups = GroupFingerprints("district_details")
 
-            district_name = sheet.cell(row=row_num, column=column_indices["District Name"]).value
-            indicator = sheet.cell(row=row_num, column=column_indices["Indicator"]).value or ""
-            definition = sheet.cell(row=row_num, column=column_indices["Definition"]).value or ""
-            data_value = sheet.cell(row=row_num, column=column_indices["Data"]).value
+        rows = iter_projected_rows(
+            sheet,
+            [column_indices[header] for header in expected_headers],
+            stop_when_empty=(column_indices["State Name"],)
+        )
+        for state_name, district_name, indicator, definition, data_value in rows:
+            indicator = indicator or ""
+            definition = definition or ""
 
             state_name = str(state_name).strip()
             district_name = str(district_name).strip()
@@ -75,16 +73,18 @@ def extract_district_details(excel_file):
             code_lower = indicator.lower().strip()
 
             if state_name not in state_codes:
-                row_num += 1
                 continue
 
             state_id = state_codes[state_name]["id"]
             district_id = state_codes[state_name].get(district_name)
 
             if not district_id:
-                row_num += 1
                 continue
 
+            row_values = (state_name, district_name, indicator, definition, data_value)
+            row_groups.add(f"states/{state_id}", (district_id,) + row_values)
+            row_groups.add(f"districts/{district_id}", row_values)
+
             # Handle values
             try:
                 if isinstance(data_value, str) and "%" in data_value:
@@ -146,7 +146,6 @@ def extract_district_details(excel_file):
                         "name": str(definition).strip(),
                         "value": processed_value
                     })
-                row_num += 1
                 continue
 
             # Add to details
@@ -155,10 +154,6 @@ def extract_district_details(excel_file):
                 "code": indicator
             })
 
-            row_num += 1
-
-        workbook.close()
-
         # Assign category type for each district
         for state_id, state_data in states_map.items():
             for dist_id, dist_data in state_data["districts"].items():
@@ -182,28 +177,20 @@ def extract_district_details(excel_file):
                     "code": "Districts driving improvements"
                 })
 
-        # ✅ Save per-district metrics.json & pie-chart.json
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        for dist_id, dist_files in district_files_map.items():
-            dist_dir = os.path.join(script_dir, "..", "districts", str(dist_id))
-            os.makedirs(dist_dir, exist_ok=True)
-
-            metrics_path = os.path.join(dist_dir, "metrics.json")
-            with open(metrics_path, "w", encoding="utf-8") as f:
-                json.dump({"metrics": dist_files["metrics"]}, f, indent=2, ensure_ascii=False)
+        changed_states = [state_id for state_id in states_map if row_groups.changed(f"states/{state_id}")]
+        changed_districts = [dist_id for dist_id in district_files_map if row_groups.changed(f"districts/{dist_id}")]
+        print(f"ℹ️ Rebuilding {len(changed_states)}/{len(states_map)} states and "
+              f"{len(changed_districts)}/{len(district_files_map)} districts with changed rows")
 
-            pie_path = os.path.join(dist_dir, "pie-chart.json")
-            with open(pie_path, "w", encoding="utf-8") as f:
-                json.dump({"data": dist_files["pie"]}, f, indent=2, ensure_ascii=False)
+        script_dir = os.path.dirname(os.path.abspath(__file__))
 
         # ✅ Upload everything (states + districts)
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
+        # Files to publish, grouped by the row group they belong to
+        group_uploads = {}
 
-        # Upload state map.json
-        for state_id, state_data in states_map.items():
+        # Save state map.json
+        for state_id in changed_states:
+            state_data = states_map[state_id]
             json_file_path = os.path.join(script_dir, "..", "states", state_id, "map.json")
             os.makedirs(os.path.dirname(json_file_path), exist_ok=True)
 
@@ -218,51 +205,62 @@ def extract_district_details(excel_file):
                 k: v for k, v in state_data["districts"].items()
             }
 
-            with open(json_file_path, "w", encoding="utf-8") as f:
-                json.dump(existing_json, f, indent=2, ensure_ascii=False)
-            folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-                bucket_name=os.environ.get("BUCKET_NAME"),
-                source_file_path=json_file_path,
-                destination_blob_name=f"sg-dashboard/states/{state_id}/map.json"
-            )
-
-            if folder_url:
-                print(f"✅ Uploaded map.json for {state_data['state_name']} to {folder_url}")
-            else:
-                print(f"❌ Failed to upload map.json for {state_data['state_name']}")
+            # map.json is read back by update_district_view_indicators, so
+            # the local copy is written before uploading
+            map_bytes = storage.render_json(existing_json)
+            storage.write_file(json_file_path, map_bytes)
+            group_uploads[f"states/{state_id}"] = [(map_bytes, f"states/{state_id}/map.json")]
 
-        # ✅ Upload district files
-        for dist_id in district_files_map.keys():
+        # ✅ Render per-district metrics.json & pie-chart.json in memory
+        for dist_id in changed_districts:
+            dist_files = district_files_map[dist_id]
             dist_dir = os.path.join(script_dir, "..", "districts", str(dist_id))
+            rendered = {
+                "metrics.json": storage.render_json({"metrics": dist_files["metrics"]}),
+                "pie-chart.json": storage.render_json({"data": dist_files["pie"]}),
+            }
+            for filename, content in rendered.items():
+                storage.mirror_file(os.path.join(dist_dir, filename), content)
+            group_uploads[f"districts/{dist_id}"] = [
+                (content, f"districts/{dist_id}/{filename}") for filename, content in rendered.items()
+            ]
+
+        # ✅ Upload everything (states + districts) as one concurrent batch
+        result = storage.upload_many(
+            [item for items in group_uploads.values() for item in items]
+        )
 
-            for filename in ["metrics.json", "pie-chart.json"]:
-                file_path = os.path.join(dist_dir, filename)
-                folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-                    bucket_name=os.environ.get("BUCKET_NAME"),
-                    source_file_path=file_path,
-                    destination_blob_name=f"sg-dashboard/districts/{dist_id}/{filename}"
-                )
-                if folder_url:
-                    print(f"✅ Uploaded {filename} for district {dist_id} to {folder_url}")
+        for group_key, items in group_uploads.items():
+            for _, key in items:
+                if result.succeeded(key):
+                    print(f"✅ Uploaded {key} to {result.folder_url(key)}")
                 else:
-                    print(f"❌ Failed to upload {filename} for district {dist_id}")
+                    print(f"❌ Failed to upload {key}: {result.failed[key]}")
+            if all(result.succeeded(key) for _, key in items):
+                row_groups.mark_published(group_key)
+
+        row_groups.save()
 
         # Upload state-details-page.json
         state_details_path = os.path.join(script_dir, "..", "pages", "state-details-page.json")
         
-        folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-            bucket_name=os.environ.get("BUCKET_NAME"),
+        folder_url = storage.upload_file(
             source_file_path=state_details_path,
-            destination_blob_name="sg-dashboard/state-details-page.json"
+            key="state-details-page.json"
         )
 
+        published = result.ok
         if folder_url:
             print(f"✅ Uploaded state-details-page.json to {folder_url}")
         else:
+            published = False
             print("❌ Failed to upload state-details-page.json")
 
+        return published
+
     except Exception as e:
         print(f"❌ Error: {str(e)}")
+        return False
 
 if __name__ == "__main__":
     import sys
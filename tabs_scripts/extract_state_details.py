@@ -1,9 +1,10 @@
-import openpyxl
 import json
 import os
 from collections import defaultdict
 from constants import PAGE_METADATA, TABS_METADATA
-import importlib.util
+from tabs_scripts.workbook_context import as_workbook_context
+from tabs_scripts.sheet_reader import iter_projected_rows, read_headers, resolve_columns
+from tabs_scripts import storage
 
 try:
     from state_code_generator import state_code_generator
@@ -23,11 +24,12 @@ except ImportError:
             print("state_code_generator function not available")
             return False
 
-def load_state_codes(excel_file):
+def load_state_codes(excel_file, generate=True):
     try:
         script_dir = os.path.dirname(os.path.abspath(__file__))
         state_codes_file = os.path.join(script_dir, "..", "pages", "state_code_details.json")
-        state_code_generator(excel_file)
+        if generate:
+            state_code_generator(excel_file)
         if not os.path.exists(state_codes_file):
             return None
         with open(state_codes_file, 'r', encoding='utf-8') as file:
@@ -35,33 +37,47 @@ def load_state_codes(excel_file):
     except Exception:
         return None
 
-def save_and_upload_state_file(script_dir, state_id, filename, data, gcp_access):
-    """Save JSON to /states/{id}/filename and upload to GCS."""
-    states_dir = os.path.join(script_dir, "..", "states", str(state_id))
-    os.makedirs(states_dir, exist_ok=True)
+def render_state_file(script_dir, state_id, filename, data, mirror_async=True):
+    """Render JSON for /states/{id}/filename; return (bytes, storage key) to upload.
 
-    file_path = os.path.join(states_dir, filename)
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    The local copy is written in the background unless mirror_async=False,
+    which is needed for files another extractor reads back.
+    """
+    content = storage.render_json(data)
+    file_path = os.path.join(script_dir, "..", "states", str(state_id), filename)
+    if mirror_async:
+        storage.mirror_file(file_path, content)
+    else:
+        storage.write_file(file_path, content)
+    return content, f"states/{state_id}/{filename}"
+
+def load_existing_map_districts(script_dir, state_id):
+    """Return the districts already published in /states/{id}/map.json."""
+    file_path = os.path.join(script_dir, "..", "states", str(state_id), "map.json")
+    if not os.path.exists(file_path):
+        return {}
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("result", {}).get("districts", {})
+    except (OSError, json.JSONDecodeError):
+        return {}
 
-    destination_blob_name = f"sg-dashboard/states/{state_id}/{filename}"
-    folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-        bucket_name=os.environ.get("BUCKET_NAME"),
-        source_file_path=file_path,
-        destination_blob_name=destination_blob_name
-    )
-    print(f"Uploaded {filename} for state {state_id}: {folder_url}")
+def update_district_view_indicators(excel_file, generate_state_codes=True):
+    """Publish district-view-indicators.json and the per-state files.
 
-def update_district_view_indicators(excel_file):
+    Pass generate_state_codes=False when state_code_generator has already run
+    for this workbook (the publish pipeline runs it as its own stage).
+    """
     try:
-        state_codes = load_state_codes(excel_file)
+        context = as_workbook_context(excel_file)
+        state_codes = load_state_codes(context, generate=generate_state_codes)
         if not state_codes:
             return
 
         script_dir = os.path.dirname(os.path.abspath(__file__))
         json_file_path = os.path.join(script_dir, "..", "pages", "district-view-indicators.json")
 
-        workbook = openpyxl.load_workbook(excel_file, data_only=False)  # data_only=False to get formatted values
+        workbook = context.workbook
 
         # --- STEP 1: Extract special indicators from HOME_PAGE tab ---
         try:
@@ -70,30 +86,27 @@ def update_district_view_indicators(excel_file):
             print(f"Sheet not found: {PAGE_METADATA['HOME_PAGE']}")
             return
 
-        home_expected_headers = TABS_METADATA["HOME_PAGE"]
-        home_col_indices = {}
-        for cell in home_page_sheet[1]:
-            if cell.value and cell.value.strip() in home_expected_headers:
-                home_col_indices[cell.value.strip()] = cell.column
+        home_col_indices, _ = resolve_columns(read_headers(home_page_sheet), TABS_METADATA["HOME_PAGE"])
 
         special_keys_lower = ["momentum partners", "nas grade 3"]
         special_indicators_map = {}
 
-        for row in home_page_sheet.iter_rows(min_row=2):
-            indicator_name = str(row[home_col_indices["Indicator"] - 1].value or "").strip()
+        home_rows = iter_projected_rows(
+            home_page_sheet,
+            [home_col_indices["Indicator"], home_col_indices["Data"]]
+        )
+        for indicator_name, data_val in home_rows:
+            indicator_name = str(indicator_name or "").strip()
             if indicator_name.lower() in special_keys_lower:
-                data_cell = row[home_col_indices["Data"] - 1]
                 if indicator_name.lower() == "nas grade 3":
                     # Get the value for NAS Grade 3 and convert to integer string
-                    data_val = data_cell.internal_value if data_cell.internal_value else ''
+                    data_val = data_val if data_val else ''
                     if isinstance(data_val, (int, float)):
                         data_val = str(int(data_val))  # Convert to integer and then to string
                     else:
                         data_val = str(data_val)  # Fallback to string if not a number
-                else:
-                    data_val = data_cell.value
-                    if isinstance(data_val, str) and "%" in data_val:
-                        data_val = data_val.strip()
+                elif isinstance(data_val, str) and "%" in data_val:
+                    data_val = data_val.strip()
                 special_indicators_map[indicator_name] = data_val
 
         # --- STEP 2: Process STATE_DETAILS tab ---
@@ -104,12 +117,7 @@ def update_district_view_indicators(excel_file):
             return
 
         expected_headers = TABS_METADATA["STATE_DETAILS"]
-        column_indices = {}
-        for cell in sheet[1]:
-            if cell.value and cell.value.strip() in expected_headers:
-                column_indices[cell.value.strip()] = cell.column
-
-        missing_columns = [col for col in expected_headers if col not in column_indices]
+        column_indices, missing_columns = resolve_columns(read_headers(sheet), expected_headers)
         if missing_columns:
             print(f"Missing required columns: {missing_columns}")
             return
@@ -121,15 +129,14 @@ def update_district_view_indicators(excel_file):
         # New collectors for per-state files
         state_collectors = {}
 
-        row_num = 2
-        while True:
-            state_name = sheet.cell(row=row_num, column=column_indices["State Name"]).value
-            if not state_name:
-                break
-
-            indicator = sheet.cell(row=row_num, column=column_indices["Indicator"]).value or ""
-            definition = sheet.cell(row=row_num, column=column_indices["Definition"]).value or ""
-            data_value = sheet.cell(row=row_num, column=column_indices["Data"]).value
+        rows = iter_projected_rows(
+            sheet,
+            [column_indices[header] for header in expected_headers],
+            stop_when_empty=(column_indices["State Name"],)
+        )
+        for state_name, indicator, definition, data_value in rows:
+            indicator = indicator or ""
+            definition = definition or ""
 
             indicator = str(indicator).strip()
             definition = str(definition).strip()
@@ -137,7 +144,6 @@ def update_district_view_indicators(excel_file):
             code_lower = indicator.lower().strip()
 
             if state_name not in state_codes:
-                row_num += 1
                 continue
             state_code = state_codes[state_name]["id"]
 
@@ -214,8 +220,6 @@ def update_district_view_indicators(excel_file):
                 if code_lower not in special_keys_lower and isinstance(processed_value, int):
                     overview_aggregates[indicator] += processed_value
 
-            row_num += 1
-
         # --- STEP 3: Assign category types for states ---
         for code, data in states_data.items():
             state_led = states_mission_data[code]["state_led_missions"]
@@ -230,8 +234,6 @@ def update_district_view_indicators(excel_file):
             else:
                 data["type"] = "category_4"
 
-        workbook.close()
-
         # --- STEP 4: Load or create JSON ---
         if os.path.exists(json_file_path):
             with open(json_file_path, 'r', encoding='utf-8') as f:
@@ -274,35 +276,31 @@ def update_district_view_indicators(excel_file):
         with open(json_file_path, 'w', encoding='utf-8') as f:
             json.dump(district_indicators, f, indent=2, ensure_ascii=False)
 
-        # Load GCP uploader
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
         private_key_path = os.path.join(script_dir, "..", "private-key.json")
 
         # Upload main file
-        folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-            bucket_name=os.environ.get("BUCKET_NAME"),
+        folder_url = storage.upload_file(
             source_file_path=json_file_path,
-            destination_blob_name="sg-dashboard/district-view-indicators.json"
+            key="district-view-indicators.json"
         )
         print(f"Uploaded district-view-indicators.json: {folder_url}")
 
-        # --- STEP 7: Save & upload per-state files ---
+        # --- STEP 7: Render per-state files, then upload them as one batch ---
+        state_uploads = []
         for state_id, data in state_collectors.items():
             # metrics.json
             metrics = {"metrics": data["missions"]}
-            save_and_upload_state_file(script_dir, state_id, "metrics.json", metrics, gcp_access)
+            state_uploads.append(render_state_file(script_dir, state_id, "metrics.json", metrics))
 
             # pie-chart.json
             pie_chart = {"data": data["categories"]}
-            save_and_upload_state_file(script_dir, state_id, "pie-chart.json", pie_chart, gcp_access)
+            state_uploads.append(render_state_file(script_dir, state_id, "pie-chart.json", pie_chart))
 
-            # map.json
+            # map.json; district pins are owned by extract_district_details,
+            # which only rewrites states whose district rows changed
             map_json = {
                 "result": {
-                    "districts": {},
+                    "districts": load_existing_map_districts(script_dir, state_id),
                     "overview": {
                         "label": data["name"].lower(),
                         "type": "category_4",
@@ -310,12 +308,22 @@ def update_district_view_indicators(excel_file):
                     }
                 }
             }
-            save_and_upload_state_file(script_dir, state_id, "map.json", map_json, gcp_access)
+            state_uploads.append(render_state_file(script_dir, state_id, "map.json", map_json, mirror_async=False))
 
+        result = storage.upload_many(state_uploads)
+        for _, key in state_uploads:
+            if result.succeeded(key):
+                print(f"Uploaded {key}: {result.folder_url(key)}")
+            else:
+                print(f"❌ Failed to upload {key}: {result.failed[key]}")
+
+        if not result.ok:
+            return False
         print("✅ All files updated & uploaded successfully.")
 
     except Exception as e:
         print(f"❌ Error: {str(e)}")
+        return False
 
 if __name__ == "__main__":
     update_district_view_indicators()
\ No newline at end of file
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import shutil
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".publish_cache")
+SHEET_FINGERPRINTS_PATH = os.path.join(CACHE_DIR, "sheet_fingerprints.json")
+GROUP_FINGERPRINTS_DIR = os.path.join(CACHE_DIR, "group_fingerprints")
+# Written by cloud-scripts/gcp_access.py
+REMOTE_MANIFEST_PATH = os.path.join(CACHE_DIR, "remote_manifest.json")
+# Stored keys of hashed-mode objects not yet part of a live release
+STAGED_RELEASE_PATH = os.path.join(CACHE_DIR, "staged_release.json")
+
+
+def _canonical_row(values):
+    return json.dumps(values, default=str, ensure_ascii=False, sort_keys=True).encode("utf-8")
+
+
+def sheet_fingerprint(sheet):
+    """Return a stable SHA-256 of a worksheet's cell values.
+
+    Only values count, not formatting: trailing empty cells of a row and
+    trailing empty rows of the sheet are ignored, while blank rows inside the
+    data are kept because some extractors read from fixed row offsets.
+    """
+    digest = hashlib.sha256()
+    blank_rows = 0
+    for row in sheet.iter_rows(values_only=True):
+        values = list(row)
+        while values and values[-1] is None:
+            values.pop()
+        if not values:
+            blank_rows += 1
+            continue
+        digest.update(b"\n" * blank_rows)
+        blank_rows = 0
+        digest.update(_canonical_row(values))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def load_json_state(path, default):
+    """Read a JSON file from the publish cache, falling back to `default`."""
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"⚠️ Ignoring unreadable cache file {path}: {e}")
+        return default
+
+
+def save_json_state(path, data):
+    """Atomically replace a JSON file in the publish cache."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_sheet_fingerprints():
+    """Return {stage name: {sheet name: hash}} from the last successful runs."""
+    return load_json_state(SHEET_FINGERPRINTS_PATH, {})
+
+
+def save_sheet_fingerprints(fingerprints):
+    save_json_state(SHEET_FINGERPRINTS_PATH, fingerprints)
+
+
+class GroupFingerprints:
+    """Row hashes per output entity (a state or district) for one extractor.
+
+    Feed each row to add() under the entity keys it contributes to; once the
+    sheet has been read, changed(key) says whether that entity's artifacts
+    differ from the last run. Call mark_published(key) after its files are
+    uploaded and save() at the end, so anything that failed is rebuilt on
+    the next run.
+    """
+
+    def __init__(self, namespace):
+        self.path = os.path.join(GROUP_FINGERPRINTS_DIR, f"{namespace}.json")
+        self.previous = load_json_state(self.path, {})
+        self._hashers = {}
+        self._published = {}
+
+    def add(self, key, row):
+        hasher = self._hashers.setdefault(key, hashlib.sha256())
+        hasher.update(_canonical_row(row))
+        hasher.update(b"\n")
+
+    def digest(self, key):
+        hasher = self._hashers.get(key)
+        return hasher.hexdigest() if hasher else None
+
+    def changed(self, key):
+        return self.previous.get(key) != self.digest(key)
+
+    def mark_published(self, key):
+        self._published[key] = self.digest(key)
+
+    def save(self):
+        fingerprints = dict(self.previous)
+        fingerprints.update(self._published)
+        save_json_state(self.path, fingerprints)
+
+
+def clear_group_fingerprints():
+    """Forget every entity hash so the next run rebuilds all artifacts."""
+    shutil.rmtree(GROUP_FINGERPRINTS_DIR, ignore_errors=True)
+
+
+def clear_remote_manifest():
+    """Forget the uploaded-object hashes so each object is checked against GCS again."""
+    try:
+        os.remove(REMOTE_MANIFEST_PATH)
+    except FileNotFoundError:
+        pass
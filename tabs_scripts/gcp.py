@@ -0,0 +1,11 @@
+import os
+import sys
+
+# cloud-scripts is not a package (its name has a hyphen), so put it on the
+# import path once and import gcp_access as a normal, cached module: the
+# service-account config, dotenv and logging setup then run once per process.
+CLOUD_SCRIPTS_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cloud-scripts"))
+if CLOUD_SCRIPTS_DIR not in sys.path:
+    sys.path.append(CLOUD_SCRIPTS_DIR)
+
+import gcp_access  # noqa: E402
@@ -1,9 +1,8 @@
-import openpyxl
 import json
 import os
-import importlib.util
 
 from constants import PAGE_METADATA,TABS_METADATA
+from tabs_scripts.workbook_context import as_workbook_context
 
 
 def goals(excel_file):
@@ -16,7 +15,7 @@ def goals(excel_file):
 
 
         # Open the Excel file
-        workbook = openpyxl.load_workbook(excel_file, data_only=True)
+        workbook = as_workbook_context(excel_file).workbook
         try:
             sheet = workbook[PAGE_METADATA["GOALS"]]
         except KeyError:
@@ -84,12 +83,7 @@ def goals(excel_file):
         with open(json_path, 'w', encoding='utf-8') as json_file:
             json.dump(json_data, json_file, indent=2, ensure_ascii=False)
 
-        # Dynamically import gcp_access module and upload file
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
-
+        # Upload file
         # private_key_path = os.path.join(script_dir, "..", "private-key.json")
 
 
@@ -107,5 +101,6 @@ def goals(excel_file):
 
     except Exception as e:
         print(f"Error: {str(e)}")
+        return False
 
 
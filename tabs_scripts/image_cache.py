@@ -0,0 +1,132 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from tabs_scripts.fingerprints import CACHE_DIR, load_json_state, save_json_state
+
+IMAGE_CACHE_DIR = os.path.join(CACHE_DIR, "images")
+DEFAULT_MAX_BYTES = int(float(os.environ.get("IMAGE_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+
+class ImageCache:
+    """Drive images kept on disk between runs, keyed by file ID and version.
+
+    The version is the file's md5Checksum, or its modifiedTime for files
+    Drive reports no checksum for, so an edited image is a new entry. Each
+    entry remembers the URLs it was published at per target (storage key
+    and rendition profile), so an unchanged image needs neither a download
+    nor an upload. Image bytes are evicted least recently used first once
+    they exceed `max_bytes`; the published-URL records are tiny and are kept.
+    """
+
+    def __init__(self, root=IMAGE_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, "index.json")
+        self.entries = load_json_state(self.index_path, {})
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def entry_key(file_id, version):
+        return f"{file_id}@{version}"
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest)
+
+    def _entry(self, file_id, version):
+        return self.entries.get(self.entry_key(file_id, version))
+
+    def published_urls(self, file_id, version, target, base_url):
+        """{rendition: URL} of this version at `target` on the backend serving `base_url`, or None."""
+        with self._lock:
+            entry = self._entry(file_id, version)
+            urls = entry and entry.get("objects", {}).get(target)
+            if isinstance(urls, dict) and urls and all(url.startswith(f"{base_url}/") for url in urls.values()):
+                entry["last_used"] = time.time()
+                return urls
+            return None
+
+    def get(self, file_id, version):
+        """Return the cached bytes of this version, or None."""
+        with self._lock:
+            entry = self._entry(file_id, version)
+            if not entry or not entry.get("hash"):
+                return None
+            try:
+                with open(self._blob_path(entry["hash"]), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                entry["hash"], entry["size"] = None, 0
+                return None
+            entry["last_used"] = time.time()
+            return data
+
+    def put(self, file_id, version, data):
+        """Store the bytes of a downloaded version, evicting old images if needed."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            entry = self.entries.setdefault(self.entry_key(file_id, version), {"objects": {}})
+            entry.update(hash=digest, size=len(data), last_used=time.time())
+            self._evict()
+
+    def record(self, file_id, version, target, urls):
+        """Remember that this version is now published for `target` at {rendition: URL}."""
+        with self._lock:
+            entry = self.entries.setdefault(
+                self.entry_key(file_id, version), {"hash": None, "size": 0, "objects": {}}
+            )
+            entry["objects"][target] = urls
+            entry["last_used"] = time.time()
+
+    def _evict(self):
+        # Entries sharing bytes share one blob, so count each blob once
+        sizes = {}
+        for entry in self.entries.values():
+            if entry.get("hash"):
+                sizes[entry["hash"]] = entry["size"]
+        total = sum(sizes.values())
+        by_age = sorted(
+            (entry for entry in self.entries.values() if entry.get("hash")),
+            key=lambda entry: entry.get("last_used", 0)
+        )
+        for entry in by_age:
+            if total <= self.max_bytes:
+                break
+            digest = entry["hash"]
+            if not digest:
+                # Already evicted along with an entry sharing its bytes
+                continue
+            for other in self.entries.values():
+                if other.get("hash") == digest:
+                    other["hash"], other["size"] = None, 0
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+            total -= sizes.pop(digest, 0)
+
+    def save(self):
+        with self._lock:
+            save_json_state(self.index_path, self.entries)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """Return the process-wide ImageCache, loading its index on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache()
+        return _cache
@@ -0,0 +1,508 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from tabs_scripts import storage
+from tabs_scripts.drive import download_file, file_version, get_files_metadata
+from tabs_scripts.drive_images import IMAGES_PREFIX, cache_target, fetch_image, image_id, publish_images
+from tabs_scripts.fingerprints import CACHE_DIR, load_json_state, save_json_state
+from tabs_scripts.image_cache import get_image_cache
+from tabs_scripts.image_optimizer import (
+    SPRITE_SHEET_SIZE,
+    profile_tag,
+    rendition_extension,
+    rendition_filenames,
+    sniff_extension,
+    sprite_cell,
+    sprite_extension,
+    sprite_sheet,
+    sprite_size,
+)
+
+IMAGE_JOBS_PATH = os.path.join(CACHE_DIR, "image_jobs.json")
+DEFAULT_JOB_WORKERS = int(os.environ.get("IMAGE_JOB_WORKERS", "4"))
+# Attempts per run; a job that still fails stays queued for the next run
+DEFAULT_JOB_ATTEMPTS = int(os.environ.get("IMAGE_JOB_ATTEMPTS", "3"))
+JOB_RETRY_MAX_DELAY = 30
+
+# How the bytes of each kind of job source are downloaded: public share
+# links, or files the service account reads through the Drive API
+FETCHERS = {"link": fetch_image, "drive": download_file}
+
+
+_downloads = {}
+_downloads_lock = threading.Lock()
+
+
+def fetch_job_source(job):
+    """Return the bytes of a job's Drive file, or None.
+
+    Cached versions are read from the image cache. Otherwise jobs that
+    need the same Drive file at the same time share a single download,
+    which is cached before it is handed out, so a file is fetched once
+    however many jobs (profiles or rows) use it.
+    """
+    cache = get_image_cache()
+    cache_id, version = job.get("cache_id") or job["file_id"], job["version"]
+    content = version and cache.get(cache_id, version)
+    if content:
+        return content
+
+    with _downloads_lock:
+        download = _downloads.get(job["file_id"])
+        owner = download is None
+        if owner:
+            download = _downloads[job["file_id"]] = Future()
+    if not owner:
+        return download.result()
+
+    try:
+        content = FETCHERS[job["source"]](job["file_id"])
+        if content and version:
+            cache.put(cache_id, version, content)
+        download.set_result(content)
+    except Exception as e:
+        download.set_exception(e)
+    finally:
+        with _downloads_lock:
+            del _downloads[job["file_id"]]
+    return download.result()
+
+
+def run_sprite_job(job):
+    """Draw and publish a sprite sheet job; returns {"src": URL} once every cell is filled, else None.
+
+    A sheet with missing images is still published, so its URL never
+    dangles, but the job fails and is redrawn when it is retried.
+    """
+    contents = [fetch_job_source(member) for member in job["members"]]
+    key = f"{job['key_prefix']}/{job['filename']}"
+    result = storage.upload_many([(sprite_sheet(contents, job["profile"]), key)])
+    if not result.ok:
+        return None
+    missing = sum(1 for content in contents if not content)
+    if missing:
+        print(f"⚠️ Sprite sheet {job['filename']} is missing {missing} images")
+        return None
+    urls = {"src": f"{result.folder_url(key).rstrip('/')}/{job['filename']}"}
+    cache = get_image_cache()
+    cache.record(job["cache_id"], job["version"], cache_target(job["key_prefix"], job["filename"], job["profile"]), urls)
+    cache.save()
+    return urls
+
+
+def run_job(job):
+    """Download, render and publish one image job; returns its {rendition: URL} or None."""
+    if job.get("kind") == "sprite":
+        return run_sprite_job(job)
+    content = fetch_job_source(job)
+    if not content:
+        return None
+    # Planned from the Drive MIME type, else sniffed (an SVG stays an SVG)
+    extension = job["extension"] or sniff_extension(content)
+    if not extension:
+        print(f"⚠️ Skipping {job['filename']}: not an image")
+        return None
+    urls = publish_images(
+        [(job.get("cache_id") or job["file_id"], job["version"], content, job["filename"], extension)],
+        job["key_prefix"],
+        job["profile"]
+    )
+    return urls.get(job["filename"])
+
+
+class ImageJobQueue:
+    """Image downloads and uploads, done by background workers instead of the extractors.
+
+    Jobs are kept in .publish_cache/image_jobs.json until their renditions
+    are published, keyed by target (storage key prefix, filename and
+    rendition profile), so references to the same image share one job;
+    submitting a new version for a target replaces its job, so an older
+    version is never published over a newer one. A failing job is
+    requeued after a backoff timer, so the workers keep draining other jobs
+    meanwhile, up to `max_attempts` times per run, and otherwise stays
+    queued for the next run's resume().
+    """
+
+    def __init__(self, path=IMAGE_JOBS_PATH, workers=DEFAULT_JOB_WORKERS, max_attempts=DEFAULT_JOB_ATTEMPTS):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.jobs = load_json_state(path, {})
+        self.results = {}
+        self.failed = {}
+        self._run_attempts = {}
+        # Job ids queued or being worked on, so each target is queued once
+        self._pending = set()
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        # Notified whenever a job leaves _pending
+        self._settled = threading.Condition(self._lock)
+
+    def _start(self):
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name="image-jobs", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _enqueue(self, job_id):
+        if job_id not in self._pending:
+            self._pending.add(job_id)
+            self._queue.put(job_id)
+
+    def submit(self, job_id, job):
+        with self._lock:
+            current = self.jobs.get(job_id)
+            if current is None or current.get("version") != job["version"]:
+                self.jobs[job_id] = dict(job, attempts=0)
+                self._run_attempts.pop(job_id, None)
+                self.failed.pop(job_id, None)
+                save_json_state(self.path, self.jobs)
+            self._enqueue(job_id)
+            self._start()
+
+    def resume(self):
+        """Queue the jobs an earlier run left; returns how many there were."""
+        with self._lock:
+            self._run_attempts.clear()
+            self.failed.clear()
+            for job_id in self.jobs:
+                self._enqueue(job_id)
+            if self.jobs:
+                self._start()
+            return len(self.jobs)
+
+    def _settle(self, job_id):
+        self._pending.discard(job_id)
+        self._settled.notify_all()
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._attempt(job_id)
+            except Exception as e:
+                print(f"❌ Image job {job_id} crashed: {e}")
+                with self._lock:
+                    self.failed[job_id] = str(e)
+                    self._settle(job_id)
+
+    def _attempt(self, job_id):
+        while True:
+            with self._lock:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    self._settle(job_id)
+                    return
+            try:
+                urls, error = run_job(job), "download or upload failed"
+            except Exception as e:
+                urls, error = None, str(e)
+
+            with self._lock:
+                if self.jobs.get(job_id) is not job:
+                    # Superseded while running; publish the newer version
+                    continue
+                if urls:
+                    del self.jobs[job_id]
+                    self.results[job_id] = urls
+                    self._run_attempts.pop(job_id, None)
+                    save_json_state(self.path, self.jobs)
+                    self._settle(job_id)
+                    return
+                job["attempts"] += 1
+                job["error"] = error
+                attempt = self._run_attempts[job_id] = self._run_attempts.get(job_id, 0) + 1
+                save_json_state(self.path, self.jobs)
+                if attempt >= self.max_attempts:
+                    self.failed[job_id] = error
+                    self._settle(job_id)
+                    print(f"❌ Image job {job_id} failed {attempt} times, kept for the next run: {error}")
+                    return
+            break
+
+        # Still pending, so wait() covers the retry; the worker moves on
+        retry = threading.Timer(min(JOB_RETRY_MAX_DELAY, 2 ** attempt), self._queue.put, args=(job_id,))
+        retry.daemon = True
+        retry.start()
+
+    def wait(self, job_ids=None):
+        """Block until the `job_ids` jobs (default: all) are published or out of attempts.
+
+        Returns {job id: URLs} of the `job_ids` jobs that were published,
+        read under the lock the workers write results with.
+        """
+        with self._lock:
+            if job_ids is None:
+                self._settled.wait_for(lambda: not self._pending)
+                return dict(self.results)
+            job_ids = set(job_ids)
+            self._settled.wait_for(lambda: not job_ids & self._pending)
+            return {job_id: self.results[job_id] for job_id in job_ids if job_id in self.results}
+
+    def exhausted(self, job_id):
+        """Whether the job is still unpublished after using up its attempts for this run."""
+        with self._lock:
+            return job_id in self.jobs and self._run_attempts.get(job_id, 0) >= self.max_attempts
+
+    def report(self):
+        """Return (jobs published, {job id: error} of failed jobs) since the last report."""
+        with self._lock:
+            published, failed = len(self.results), dict(self.failed)
+            self.results.clear()
+            self.failed.clear()
+            return published, failed
+
+    def __len__(self):
+        with self._lock:
+            return len(self.jobs)
+
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+
+def get_image_jobs():
+    """Return the process-wide ImageJobQueue, loading its jobs on first use."""
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            _jobs = ImageJobQueue()
+        return _jobs
+
+
+_tracking = threading.local()
+
+
+@contextmanager
+def track_images():
+    """Collect the image targets the calling thread queues while the block runs.
+
+    Yields {"planned": set(), "missing": set()}: the targets written into
+    pages at the URLs their jobs will publish to (direct mode), and the ones
+    left out of pages because they are not published (hashed mode, or out
+    of attempts). Trackers nest, and each sees every target.
+    """
+    images = {"planned": set(), "missing": set()}
+    stack = _tracking.__dict__.setdefault("stack", [])
+    stack.append(images)
+    try:
+        yield images
+    finally:
+        stack.remove(images)
+
+
+def _track(kind, target):
+    for images in getattr(_tracking, "stack", ()):
+        images[kind].add(target)
+
+
+def exhausted_images(targets):
+    """Return the `targets` whose jobs ran out of attempts in this run."""
+    jobs = get_image_jobs()
+    return {target for target in targets if jobs.exhausted(target)}
+
+
+def _queue_images(entries, profile, source):
+    """Queue (file_id, Drive metadata or None) images; returns {file_id: {rendition: URL}}.
+
+    Images are published under IMAGES_PREFIX and named by image_id, so
+    files with identical bytes are queued, rendered and uploaded once.
+    Images whose Drive version is already published keep their published
+    URLs and are not queued. The others get the URLs their renditions will
+    be published at, known in advance from the image id and the file's
+    MIME type, so pages can be written before the workers are done. In
+    hashed mode object URLs depend on the rendered bytes, and without a
+    MIME type the extension is only known once the bytes are downloaded;
+    those images are waited for and only the ones that were published are
+    returned. Images whose job is out of attempts for this run are left
+    out, so pages keep their default until a later run publishes them.
+    """
+    cache = get_image_cache()
+    backend = storage.get_backend()
+    base_url = backend.base_url()
+    jobs = get_image_jobs()
+    urls = {}
+    queued = {}
+    for file_id, metadata in entries:
+        version = metadata and file_version(metadata)
+        cache_id = image_id(file_id, metadata)
+        filename = f"{cache_id}-{profile}"
+        target = cache_target(IMAGES_PREFIX, filename, profile)
+        published = version and cache.published_urls(cache_id, version, target, base_url)
+        if published:
+            urls[file_id] = published
+            continue
+        if jobs.exhausted(target):
+            _track("missing", target)
+            continue
+
+        extension = rendition_extension(metadata and metadata.get("mimeType"))
+        if target not in queued.values():
+            jobs.submit(target, {
+                "file_id": file_id,
+                "cache_id": cache_id,
+                "version": version,
+                "filename": filename,
+                "key_prefix": IMAGES_PREFIX,
+                "profile": profile,
+                "extension": extension,
+                "source": source,
+            })
+        queued[file_id] = target
+        if backend.mode == storage.DIRECT and extension:
+            _track("planned", target)
+            urls[file_id] = {
+                name: backend.public_url(f"{IMAGES_PREFIX}/{rendition_filename}")
+                for name, rendition_filename in rendition_filenames(filename, profile, extension).items()
+            }
+
+    if queued:
+        print(f"🖼️ Queued {len(set(queued.values()))} images for {len(queued)} Drive files")
+    waiting = {file_id: target for file_id, target in queued.items() if file_id not in urls}
+    if waiting:
+        results = jobs.wait(waiting.values())
+        for file_id, target in waiting.items():
+            if target in results:
+                urls[file_id] = results[target]
+            else:
+                _track("missing", target)
+    return urls
+
+
+def queue_drive_images(file_ids, profile, metadata=None):
+    """Queue publicly shared Drive files for publishing; see _queue_images.
+
+    `metadata` ({file_id: Drive metadata}) is fetched when not given.
+    """
+    file_ids = list(dict.fromkeys(file_ids))
+    if metadata is None:
+        metadata = get_files_metadata(file_ids)
+    return _queue_images([(file_id, metadata.get(file_id)) for file_id in file_ids], profile, "link")
+
+
+def queue_folder_images(files, profile):
+    """Queue files from a Drive folder listing (see FolderListings) for publishing; see _queue_images."""
+    return _queue_images([(file["id"], file) for file in files], profile, "drive")
+
+
+def queue_sprite_sheets(file_ids, profile, metadata=None):
+    """Queue sprite sheets of publicly shared Drive images; returns {file_id: sprite cell}.
+
+    The `profile` renditions are packed SPRITE_SHEET_SIZE to a sheet, in
+    `file_ids` order, so a wall of logos loads in a few requests. Files
+    with the same bytes share a cell. SVGs are left out (they are not
+    rasterized), and so are files without a known content version, whose
+    sheet could never be reused. `metadata` is fetched when not given. A cell is {"src", "x", "y", "width", "height",
+    "sheetWidth", "sheetHeight"} in pixels of the sheet at `src`. Sheets
+    are named after their images and queued like single images (see
+    _queue_images), so the cells are known before they are drawn.
+    """
+    file_ids = list(dict.fromkeys(file_ids))
+    if metadata is None:
+        metadata = get_files_metadata(file_ids)
+    members = {}
+    member_of = {}
+    for file_id in file_ids:
+        file_metadata = metadata.get(file_id)
+        version = file_metadata and file_version(file_metadata)
+        if not version or file_metadata.get("mimeType") == "image/svg+xml":
+            continue
+        cache_id = image_id(file_id, file_metadata)
+        members.setdefault(cache_id, {
+            "file_id": file_id,
+            "cache_id": cache_id,
+            "version": version,
+            "source": "link",
+        })
+        member_of[file_id] = cache_id
+
+    cache = get_image_cache()
+    backend = storage.get_backend()
+    base_url = backend.base_url()
+    jobs = get_image_jobs()
+    sheet_urls = {}
+    cells = {}
+    queued = []
+    ordered = list(members.values())
+    for start in range(0, len(ordered), SPRITE_SHEET_SIZE):
+        chunk = ordered[start:start + SPRITE_SHEET_SIZE]
+        digest = hashlib.sha256(json.dumps(
+            [profile_tag(profile)] + [[member["cache_id"], member["version"]] for member in chunk]
+        ).encode("utf-8")).hexdigest()[:16]
+        filename = f"sprite-{digest}-{profile}{sprite_extension()}"
+        target = cache_target(IMAGES_PREFIX, filename, profile)
+        published = cache.published_urls(filename, digest, target, base_url)
+        if published:
+            sheet_urls[target] = published["src"]
+        elif jobs.exhausted(target):
+            _track("missing", target)
+        else:
+            jobs.submit(target, {
+                "kind": "sprite",
+                "members": chunk,
+                "cache_id": filename,
+                "version": digest,
+                "filename": filename,
+                "key_prefix": IMAGES_PREFIX,
+                "profile": profile,
+            })
+            queued.append(target)
+            if backend.mode == storage.DIRECT:
+                _track("planned", target)
+                sheet_urls[target] = backend.public_url(f"{IMAGES_PREFIX}/{filename}")
+
+        width, height = sprite_size(len(chunk), profile)
+        for index, member in enumerate(chunk):
+            x, y, size = sprite_cell(index, profile)
+            cells[member["cache_id"]] = (target, {
+                "x": x, "y": y, "width": size, "height": size, "sheetWidth": width, "sheetHeight": height
+            })
+
+    if queued:
+        print(f"🖼️ Queued {len(queued)} sprite sheets of {len(members)} images")
+    if backend.mode == storage.HASHED and queued:
+        results = jobs.wait(queued)
+        for target in queued:
+            if target in results:
+                sheet_urls[target] = results[target]["src"]
+            else:
+                _track("missing", target)
+
+    sprites = {}
+    for file_id, cache_id in member_of.items():
+        target, cell = cells[cache_id]
+        if target in sheet_urls:
+            sprites[file_id] = dict(src=sheet_urls[target], **cell)
+    return sprites
+
+
+def resume_image_jobs():
+    """Restart the image jobs an earlier run left unfinished; returns how many there were."""
+    count = get_image_jobs().resume()
+    if count:
+        print(f"🔁 Resuming {count} image jobs")
+    return count
+
+
+def outstanding_image_jobs():
+    """Number of image jobs that have not been published yet."""
+    return len(get_image_jobs())
+
+
+def wait_for_image_jobs():
+    """Wait for the queued image jobs and report them; returns True when none failed."""
+    jobs = get_image_jobs()
+    jobs.wait()
+    published, failed = jobs.report()
+    if published:
+        print(f"✅ Published {published} queued images")
+    if failed:
+        print(f"⚠️ {len(failed)} image jobs failed; {len(jobs)} are kept for the next run")
+    return not failed
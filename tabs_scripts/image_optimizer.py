@@ -0,0 +1,175 @@
+import io
+import os
+import posixpath
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Output format of raster renditions: "webp" (default) or "jpeg"; with jpeg,
+# source formats that can carry transparency are written as PNG instead
+IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "webp").strip().lower()
+# Bumped whenever renditions change, so cached published URLs are rebuilt
+OPTIMIZER_VERSION = 2
+
+# Longest edge in pixels of each rendition, per kind of widget
+PROFILES = {
+    "logo": {"src": 256},
+    "icon": {"src": 128},
+    "photo": {"src": 1600, "thumbnail": 400},
+}
+QUALITY = {"logo": 90, "icon": 90, "photo": 80}
+# Images packed into one sprite sheet, drawn in rows of SPRITE_COLUMNS
+# square cells as large as the profile's "src" rendition
+SPRITE_SHEET_SIZE = int(os.environ.get("SPRITE_SHEET_SIZE", "64"))
+SPRITE_COLUMNS = 8
+
+ENCODINGS = {".webp": "WEBP", ".jpg": "JPEG", ".png": "PNG"}
+
+
+def profile_tag(profile):
+    """Identifies the renditions a profile produces under the current settings."""
+    return f"{profile}-{IMAGE_FORMAT}-v{OPTIMIZER_VERSION}"
+
+
+def is_svg(data):
+    head = data[:1024].lstrip().lower()
+    return head.startswith(b"<svg") or (head.startswith(b"<?xml") and b"<svg" in data[:4096].lower())
+
+
+def rendition_extension(mime_type):
+    """Extension every rendition of an image gets, decided from its Drive MIME type.
+
+    It is known before the image is downloaded, so the URLs renditions will
+    be published at can be written into pages straight away. SVGs and GIFs
+    (which may be animated) keep their format; other images are re-encoded
+    as IMAGE_FORMAT. Without a MIME type it is None, and sniff_extension
+    decides once the bytes are downloaded.
+    """
+    if mime_type is None:
+        return None
+    if mime_type == "image/svg+xml":
+        return ".svg"
+    if mime_type == "image/gif":
+        return ".gif"
+    if IMAGE_FORMAT == "jpeg":
+        return ".jpg" if mime_type in (None, "image/jpeg") else ".png"
+    return ".webp"
+
+
+def sniff_extension(data):
+    """rendition_extension for downloaded bytes, from their content; None if they are no image."""
+    if is_svg(data):
+        return ".svg"
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return rendition_extension(Image.MIME.get(image.format, "image/png"))
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+def rendition_filenames(filename, profile, extension):
+    """Return {rendition: filename} image_renditions produces for an image of this extension."""
+    stem = posixpath.splitext(filename)[0]
+    if extension not in ENCODINGS:
+        return {"src": f"{stem}{extension}"}
+    return {
+        name: f"{stem}{'' if name == 'src' else f'.{name}'}{extension}"
+        for name in PROFILES[profile]
+    }
+
+
+def _has_alpha(image):
+    return image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def _encode(image, extension, quality):
+    buffer = io.BytesIO()
+    if extension == ".jpg":
+        if _has_alpha(image):
+            # JPEG has no transparency; flatten onto white rather than black
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+            image = background
+        image.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    elif extension == ".png":
+        image.convert("RGBA" if _has_alpha(image) else "RGB").save(buffer, format="PNG", optimize=True)
+    else:
+        image.convert("RGBA" if _has_alpha(image) else "RGB").save(buffer, format="WEBP", quality=quality, method=6)
+    return buffer.getvalue()
+
+
+def image_renditions(data, filename, profile, extension):
+    """Return {rendition: (filename, bytes)} to publish for an image.
+
+    Renditions are named by rendition_filenames. Raster images are bounded
+    to the profile's sizes (never upscaled, EXIF orientation applied) and
+    encoded as `extension`, with a ".thumbnail" rendition where the profile
+    has one; an animated image is reduced to its first frame. SVGs and GIFs
+    are kept as they are. Returns None when `data` is not an image of the
+    kind `extension` expects.
+    """
+    filenames = rendition_filenames(filename, profile, extension)
+    if extension == ".svg":
+        return {"src": (filenames["src"], data)} if is_svg(data) else None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if extension == ".gif":
+                return {"src": (filenames["src"], data)} if image.format == "GIF" else None
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    renditions = {}
+    for name, max_edge in PROFILES[profile].items():
+        rendition = image.copy()
+        rendition.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        renditions[name] = (filenames[name], _encode(rendition, extension, QUALITY[profile]))
+    return renditions
+
+
+def sprite_extension():
+    """Extension of sprite sheets: WebP, or PNG (for transparency) when IMAGE_FORMAT is jpeg."""
+    return ".webp" if IMAGE_FORMAT == "webp" else ".png"
+
+
+def sprite_cell(index, profile):
+    """Return (x, y, size) of the cell the image at `index` of a sprite sheet is drawn in."""
+    size = PROFILES[profile]["src"]
+    return (index % SPRITE_COLUMNS) * size, (index // SPRITE_COLUMNS) * size, size
+
+
+def sprite_size(count, profile):
+    """Return (width, height) of a sprite sheet of `count` images."""
+    size = PROFILES[profile]["src"]
+    return min(count, SPRITE_COLUMNS) * size, -(-count // SPRITE_COLUMNS) * size
+
+
+def sprite_sheet(images, profile):
+    """Draw images into one sprite sheet and return its bytes.
+
+    `images` are the source bytes of each cell in order; None, SVGs and
+    anything that is not an image leave their cell empty. Each image is
+    fitted into its cell (see sprite_cell) and centred on a transparent
+    background.
+    """
+    sheet = Image.new("RGBA", sprite_size(len(images), profile), (0, 0, 0, 0))
+    for index, data in enumerate(images):
+        if not data or is_svg(data):
+            continue
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image = ImageOps.exif_transpose(image)
+                image.load()
+        except (UnidentifiedImageError, OSError):
+            continue
+        x, y, size = sprite_cell(index, profile)
+        image = image.convert("RGBA")
+        image.thumbnail((size, size), Image.LANCZOS)
+        sheet.paste(image, (x + (size - image.width) // 2, y + (size - image.height) // 2), image)
+
+    buffer = io.BytesIO()
+    if sprite_extension() == ".png":
+        sheet.save(buffer, format="PNG", optimize=True)
+    else:
+        sheet.save(buffer, format="WEBP", quality=QUALITY[profile], method=6)
+    return buffer.getvalue()
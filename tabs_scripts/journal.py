@@ -0,0 +1,113 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+from tabs_scripts.fingerprints import CACHE_DIR, load_json_state, save_json_state
+
+JOURNAL_PATH = os.path.join(CACHE_DIR, "publish_journal.json")
+PAYLOAD_DIR = os.path.join(CACHE_DIR, "journal_payloads")
+
+
+def task_id(key, digest):
+    return f"{key}@{digest}"
+
+
+class PublishJournal:
+    """On-disk record of uploads that were planned but have not completed.
+
+    Every upload is planned before it is sent, as a task keyed by storage
+    key and the SHA-256 of its bytes; only that is written, in one small
+    file per batch. Completed tasks are dropped. Failed ones count their
+    attempts and their bytes are saved under the hash, so
+    outstanding() hands back exactly the uploads that are still missing
+    without the workbook being read or rendered again. A task a crash
+    interrupted has no saved bytes; it is dropped, and the files are
+    rendered again because their fingerprints were never saved. Planning a
+    key again supersedes any older task for it, so a stale version is never
+    uploaded over a newer one.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, payload_dir=PAYLOAD_DIR):
+        self.path = path
+        self.payload_dir = payload_dir
+        self.tasks = load_json_state(path, {})
+        # Tasks planned by this process whose upload has not settled yet
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def _payload_path(self, digest):
+        return os.path.join(self.payload_dir, digest)
+
+    def _write_payload(self, digest, data):
+        path = self._payload_path(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(self.payload_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.payload_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _drop(self, tid):
+        task = self.tasks.pop(tid, None)
+        self._in_flight.discard(tid)
+        if task is None:
+            return
+        if not any(other["hash"] == task["hash"] for other in self.tasks.values()):
+            try:
+                os.remove(self._payload_path(task["hash"]))
+            except FileNotFoundError:
+                pass
+
+    def plan(self, items):
+        """Record (bytes, key) uploads; returns (bytes, key, task id) triples."""
+        planned = []
+        with self._lock:
+            for data, key in items:
+                digest = hashlib.sha256(data).hexdigest()
+                tid = task_id(key, digest)
+                for other in [other for other, task in self.tasks.items() if task["key"] == key and other != tid]:
+                    self._drop(other)
+                self.tasks.setdefault(tid, {"key": key, "hash": digest, "attempts": 0})
+                self._in_flight.add(tid)
+                planned.append((data, key, tid))
+            save_json_state(self.path, self.tasks)
+        return planned
+
+    def settle(self, planned, failed):
+        """Drop completed tasks; save the bytes of those whose key is in `failed` ({key: error})."""
+        with self._lock:
+            for data, key, tid in planned:
+                if tid not in self.tasks:
+                    continue
+                if key in failed:
+                    task = self.tasks[tid]
+                    self._write_payload(task["hash"], data)
+                    task["attempts"] += 1
+                    task["error"] = str(failed[key])
+                    self._in_flight.discard(tid)
+                else:
+                    self._drop(tid)
+            save_json_state(self.path, self.tasks)
+
+    def outstanding(self):
+        """Return (bytes, key, task id) for every upload still to be done."""
+        pending = []
+        with self._lock:
+            for tid, task in list(self.tasks.items()):
+                if tid in self._in_flight:
+                    continue
+                try:
+                    with open(self._payload_path(task["hash"]), "rb") as f:
+                        pending.append((f.read(), task["key"], tid))
+                except FileNotFoundError:
+                    # Interrupted before it settled; its files are rendered again
+                    print(f"⚠️ Dropping journal entry {tid}: its upload never settled")
+                    self._drop(tid)
+            save_json_state(self.path, self.tasks)
+        return pending
+
+    def __len__(self):
+        with self._lock:
+            return len(self.tasks)
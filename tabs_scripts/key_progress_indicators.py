@@ -1,38 +1,11 @@
-import openpyxl
 import json
 import os
-import importlib.util
-import re
-import requests
 
 from constants import PAGE_METADATA,TABS_METADATA
-
-def convert_drive_link_to_direct_url(link):
-    if not isinstance(link, str):
-        return ''
-    match = re.search(r"/d/([a-zA-Z0-9_-]+)", link)
-    if not match:
-        match = re.search(r"id=([a-zA-Z0-9_-]+)", link)
-    if match:
-        file_id = match.group(1)
-        return f"https://drive.google.com/uc?export=view&id={file_id}"
-    return link.strip()
-
-def download_image(file_id, save_path):
-    url = f"https://drive.google.com/uc?export=download&id={file_id}"
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(save_path, 'wb') as f:
-                f.write(response.content)
-            print(f"✅ Downloaded image to {save_path}")
-            return True
-        else:
-            print(f"❌ Failed to download image for file ID {file_id}")
-            return False
-    except Exception as e:
-        print(f"❌ Exception downloading image: {e}")
-        return False
+from tabs_scripts.workbook_context import as_workbook_context
+from tabs_scripts.drive_images import drive_file_id
+from tabs_scripts.image_jobs import queue_drive_images
+from tabs_scripts import storage
 
 def key_progress_indicators(excel_file):
     try:
@@ -41,11 +14,9 @@ def key_progress_indicators(excel_file):
         print(script_dir)
         # Define the path to the JSON file
         json_path = os.path.join(script_dir, "..", "pages", "landing-page.json")
-        images_dir = os.path.join(script_dir, "temp_downloads")
-        os.makedirs(images_dir, exist_ok=True)
 
         # Open the Excel file
-        workbook = openpyxl.load_workbook(excel_file, data_only=False)  # data_only=False to get formatted values
+        workbook = as_workbook_context(excel_file).workbook
         try:
             sheet = workbook[PAGE_METADATA["HOME_PAGE"]]
         except KeyError:
@@ -64,6 +35,8 @@ def key_progress_indicators(excel_file):
 
         # Extract data rows
         data = []
+        # (row_data, file_id) of icons, queued together after the sheet is read
+        icon_rows = []
         for row_idx, row in enumerate(sheet.iter_rows(min_row=2), start=2):  # Use cell objects, not values_only
             try:
                 raw_name = row[cleaned_headers.index(TABS_METADATA["HOME_PAGE"][0])].value
@@ -71,49 +44,20 @@ def key_progress_indicators(excel_file):
                     continue
 
                 raw_src = row[cleaned_headers.index(TABS_METADATA["HOME_PAGE"][3])].value or ''
-                logo_url = convert_drive_link_to_direct_url(raw_src)
-
-                file_match = re.search(r"id=([a-zA-Z0-9_-]+)", logo_url)
-                if not file_match:
-                    file_match = re.search(r"/d/([a-zA-Z0-9_-]+)", raw_src)
-                file_id = file_match.group(1) if file_match else ''
-
-                name_clean = str(raw_name).strip().lower()
-                name_clean = re.sub(r'[^a-z0-9_-]', '', name_clean.replace(" ", "_"))
-                local_filename = f"{name_clean}.svg"
-                local_path = os.path.join(images_dir, local_filename)
-
-                if file_id:
-                    if download_image(file_id, local_path):
-                         gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-                         spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-                         gcp_access = importlib.util.module_from_spec(spec)
-                         spec.loader.exec_module(gcp_access)
-
-                         folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-                            bucket_name=os.environ.get("BUCKET_NAME"),
-                            source_file_path=local_path,
-                            destination_blob_name = f"sg-dashboard/partners/{local_filename}"
-                         )
-
-                         if folder_url:
-                            os.remove(local_path)
-                            final_src = f"{folder_url.rstrip('/')}/{local_filename}"
-                            print(f"Successfully uploaded and got public folder URL: {folder_url}, {final_src}")
-                         else:
-                            print("Failed to upload file to GCS. Check logs for details.")
+                file_id = drive_file_id(raw_src)
 
                 # Get the formatted value for the 'value' column
                 value_cell = row[cleaned_headers.index(TABS_METADATA["HOME_PAGE"][2])]
                 row_data = {
                     'label': raw_name or '',
                     'value': value_cell.value or '',  # Start with raw value
-                    'icon': final_src or ''
+                    'icon': ''  # Set to the icon's published URL once the icons are queued
                 }
                 # For 'NAS Grade 3', get the formatted text (e.g., "59%")
                 if row_data['label'] == 'NAS Grade 3':
-                    row_data['value'] = value_cell.internal_value if value_cell.internal_value else ''
-                    if value_cell.number_format and '%' in value_cell.number_format:
+                    # Read-only sheets give an EmptyCell (no internal_value) for an empty value
+                    row_data['value'] = value_cell.value if value_cell.value else ''
+                    if row_data['value'] and value_cell.number_format and '%' in value_cell.number_format:
                         # If the cell is formatted as percentage, get the display value as an integer
                         row_data['value'] = f"{int(value_cell.value * 100)}%"
                     else:
@@ -124,10 +68,19 @@ def key_progress_indicators(excel_file):
                     row_data['value'] = int(row_data['value'])
                 
                 data.append(row_data)
+                if file_id:
+                    icon_rows.append((row_data, file_id))
             except Exception as e:
                 print(f"Error processing row {row_idx}: {str(e)}")
                 continue
 
+        icon_urls = queue_drive_images(
+            (file_id for _, file_id in icon_rows), "icon"
+        )
+        for row_data, file_id in icon_rows:
+            if file_id in icon_urls:
+                row_data['icon'] = icon_urls[file_id]['src']
+
         # Read the existing JSON file
         with open(json_path, 'r', encoding='utf-8') as json_file:
             raw_content = json_file.read()
@@ -160,24 +113,19 @@ def key_progress_indicators(excel_file):
         with open(json_path, 'w', encoding='utf-8') as json_file:
             json.dump(json_data, json_file, indent=2, ensure_ascii=False)
 
-        # Dynamically import gcp_access module and upload file
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
-
+        # Upload file
         private_key_path = os.path.join(script_dir, "..", "private-key.json")
 
-        folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-            bucket_name=os.environ.get("BUCKET_NAME"),
+        folder_url = storage.upload_file(
             source_file_path=json_path,
-            destination_blob_name="sg-dashboard/landing-page.json"
+            key="landing-page.json"
         )
 
         if folder_url:
             print(f"Successfully uploaded and got public folder URL: {folder_url}")
         else:
             print("Failed to upload file to GCS. Check logs for details.")
+            return False
 
     except Exception as e:
         print(f"Error: {str(e)}")
\ No newline at end of file
@@ -1,10 +1,11 @@
 from io import BytesIO
-import openpyxl
 import json
 import os
-import importlib.util
 
 from constants import PAGE_METADATA
+from tabs_scripts.workbook_context import as_workbook_context
+from tabs_scripts.sheet_reader import iter_projected_rows
+from tabs_scripts import storage
 
 def extract_micro_improvements(excel_file):
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -13,9 +14,10 @@ def extract_micro_improvements(excel_file):
     json_path = os.path.join(script_dir, "..", "pages", "dashboard.json")
 
     # Open the Excel file
-    workbook = openpyxl.load_workbook(excel_file, data_only=True)
+    context = as_workbook_context(excel_file)
+    workbook = context.workbook
     try:
-        sheet = workbook["Micro improvements progress"]
+        sheet = workbook[PAGE_METADATA["MICRO_IMPROVEMENTS"]]
     except KeyError:
         print("Error: Sheet 'Micro improvements progress' not found in the Excel file.")
         print(f"Available sheets: {workbook.sheetnames}")
@@ -102,15 +104,29 @@ def extract_micro_improvements(excel_file):
             json.dump(dashboard_data, file, indent=2)
 
         print(f"Updated dashboard.json with new line-chart data: {json.dumps(result, indent=2)}")
-        extract_state_line_chart(excel_file)
+
+        # pie_chart only runs when its own sheets change, so publish the
+        # line-chart section here (this stage runs after it)
+        folder_url = storage.upload_file(
+            source_file_path=json_path,
+            key="dashboard.json"
+        )
+        if folder_url:
+            print(f"Successfully uploaded and got public folder URL: {folder_url}")
+        else:
+            print("Failed to upload file to GCS. Check logs for details.")
+
+        # Failed state/district line-chart uploads fail the stage so it is retried
+        if extract_state_line_chart(context) is False or not folder_url:
+            return False
         return json.dumps(dashboard_data, indent=2)
 
     except FileNotFoundError:
         print(f"Error: dashboard.json not found at {json_path}")
-        return json.dumps(result, indent=2)
+        return False
     except Exception as e:
         print(f"Error updating dashboard.json: {str(e)}")
-        return json.dumps(result, indent=2)
+        return False
 
 def load_state_codes():
     """Load state and district codes from state_code_details.json."""
@@ -131,9 +147,9 @@ def extract_district_line_chart(excel_file):
             return
 
         # Load Excel file
-        workbook = openpyxl.load_workbook(excel_file, data_only=True)
+        workbook = as_workbook_context(excel_file).workbook
         try:
-            sheet = workbook["Micro improvements progress"]
+            sheet = workbook[PAGE_METADATA["MICRO_IMPROVEMENTS"]]
         except KeyError:
             print("Error: Sheet 'Micro improvements progress' not found in the Excel file.")
             print(f"Available sheets: {workbook.sheetnames}")
@@ -142,27 +158,15 @@ def extract_district_line_chart(excel_file):
         # Initialize district-level containers for line chart data
         district_files_map = {}
 
-        # Iterate through rows, starting from row 2 to skip headers
-        row_num = 2
-        while True:
-            state_name = sheet.cell(row=row_num, column=1).value
-            district_name = sheet.cell(row=row_num, column=2).value
-            year = sheet.cell(row=row_num, column=3).value
-            q1 = sheet.cell(row=row_num, column=4).value
-            q2 = sheet.cell(row=row_num, column=5).value
-            q3 = sheet.cell(row=row_num, column=6).value
-            q4 = sheet.cell(row=row_num, column=7).value
-
-            if not state_name and not district_name:
-                break
-
+        # Iterate through rows, starting from row 2 to skip headers (columns A-G)
+        rows = iter_projected_rows(sheet, range(7), stop_when_empty=(0, 1))
+        for row_num, (state_name, district_name, year, q1, q2, q3, q4) in enumerate(rows, start=2):
             state_name = str(state_name).strip() if state_name else ""
             district_name = str(district_name).strip() if district_name else ""
 
             # Skip if state_name is not in state_codes
             if state_name not in state_codes:
                 print(f"⚠️ State '{state_name}' not found in state_code_details.json, skipping row {row_num}")
-                row_num += 1
                 continue
 
             state_id = state_codes[state_name]["id"]
@@ -171,7 +175,6 @@ def extract_district_line_chart(excel_file):
             # Skip if district_id is not found
             if not district_id:
                 print(f"⚠️ District '{district_name}' not found for state '{state_name}' in state_code_details.json, skipping row {row_num}")
-                row_num += 1
                 continue
 
             # Initialize district entry if not exists
@@ -212,15 +215,11 @@ def extract_district_line_chart(excel_file):
                     district_files_map[district_id]["line_chart"][2025]['Q4'] += float(q4)
                     district_files_map[district_id]["line_chart"][2025]['valid_Q4'] = True
 
-            row_num += 1
-
-        workbook.close()
-
-        # Save line-chart.json for each district
+        # Render line-chart.json for each district
         script_dir = os.path.dirname(os.path.abspath(__file__))
+        district_uploads = []
         for dist_id, dist_data in district_files_map.items():
             dist_dir = os.path.join(script_dir, "..", "districts", str(dist_id))
-            os.makedirs(dist_dir, exist_ok=True)
 
             # Format line chart data, including only quarters with valid data
             line_chart_data = []
@@ -235,32 +234,25 @@ def extract_district_line_chart(excel_file):
                         "data": data
                     })
 
-            # Save line-chart.json
-            line_chart_path = os.path.join(dist_dir, "line-chart.json")
-            with open(line_chart_path, "w", encoding="utf-8") as f:
-                json.dump({"data": line_chart_data}, f, indent=2, ensure_ascii=False)
+            # Render line-chart.json; the local copy is written in the background
+            content = storage.render_json({"data": line_chart_data})
+            storage.mirror_file(os.path.join(dist_dir, "line-chart.json"), content)
 
             print(f"✅ Generated line-chart.json for district {dist_id} ({dist_data['district_name']})")
+            district_uploads.append((content, f"districts/{dist_id}/line-chart.json"))
 
-            # Upload district line-chart.json files to GCP
-            gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-            spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-            gcp_access = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(gcp_access)
-
-            file_path = os.path.join(dist_dir, "line-chart.json")
-            folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-                bucket_name=os.environ.get("BUCKET_NAME"),
-                source_file_path=file_path,
-                destination_blob_name=f"sg-dashboard/districts/{dist_id}/line-chart.json"
-            )
-            if folder_url:
-                print(f"✅ Uploaded line-chart.json for district {dist_id} to {folder_url}")
+        # Upload district line-chart.json files to GCP as one batch
+        result = storage.upload_many(district_uploads)
+        for _, key in district_uploads:
+            if result.succeeded(key):
+                print(f"✅ Uploaded {key} to {result.folder_url(key)}")
             else:
-                print(f"❌ Failed to upload line-chart.json for district {dist_id}")
+                print(f"❌ Failed to upload {key}: {result.failed[key]}")
+        return result.ok
 
     except Exception as e:
         print(f"❌ Error: {str(e)}")
+        return False
 
 def load_state_codes():
     """Load state codes from state_code_details.json."""
@@ -276,25 +268,11 @@ def load_state_codes():
         print(f"❌ Error loading state codes: {str(e)}")
         return None
 
-def save_and_upload_state_file(script_dir, state_id, filename, data, gcp_access):
-    """Save JSON to /states/{id}/filename and upload to GCS."""
-    states_dir = os.path.join(script_dir, "..", "states", str(state_id))
-    os.makedirs(states_dir, exist_ok=True)
-
-    file_path = os.path.join(states_dir, filename)
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-    destination_blob_name = f"sg-dashboard/states/{state_id}/{filename}"
-    folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-        bucket_name=os.environ.get("BUCKET_NAME"),
-        source_file_path=file_path,
-        destination_blob_name=destination_blob_name
-    )
-    if folder_url:
-        print(f"✅ Uploaded {filename} for state {state_id}: {folder_url}")
-    else:
-        print(f"❌ Failed to upload {filename} for state {state_id}")
+def render_state_file(script_dir, state_id, filename, data):
+    """Render JSON for /states/{id}/filename; return (bytes, storage key) to upload."""
+    content = storage.render_json(data)
+    storage.mirror_file(os.path.join(script_dir, "..", "states", str(state_id), filename), content)
+    return content, f"states/{state_id}/{filename}"
 
 def extract_state_line_chart(excel_file):
     """Extract data from 'Micro improvements progress' sheet and generate line-chart.json for each state, excluding district data."""
@@ -305,9 +283,10 @@ def extract_state_line_chart(excel_file):
             return
 
         # Load Excel file
-        workbook = openpyxl.load_workbook(excel_file, data_only=True)
+        context = as_workbook_context(excel_file)
+        workbook = context.workbook
         try:
-            sheet = workbook["Micro improvements progress"]
+            sheet = workbook[PAGE_METADATA["MICRO_IMPROVEMENTS"]]
         except KeyError:
             print("Error: Sheet 'Micro improvements progress' not found in the Excel file.")
             print(f"Available sheets: {workbook.sheetnames}")
@@ -316,29 +295,16 @@ def extract_state_line_chart(excel_file):
         # Initialize state-level containers for line chart data
         state_line_chart_map = {}
 
-        # Iterate through rows, starting from row 2 to skip headers
-        row_num = 2
-        while True:
-            state_name = sheet.cell(row=row_num, column=1).value
-            district_name = sheet.cell(row=row_num, column=2).value
-            year = sheet.cell(row=row_num, column=3).value
-            q1 = sheet.cell(row=row_num, column=4).value
-            q2 = sheet.cell(row=row_num, column=5).value
-            q3 = sheet.cell(row=row_num, column=6).value
-            q4 = sheet.cell(row=row_num, column=7).value
-
-            if not state_name:
-                break
-
+        # Iterate through rows, starting from row 2 to skip headers (columns A-G)
+        rows = iter_projected_rows(sheet, range(7), stop_when_empty=(0,))
+        for row_num, (state_name, district_name, year, q1, q2, q3, q4) in enumerate(rows, start=2):
             # Skip rows with district data
             if district_name:
-                row_num += 1
                 continue
 
             state_name = str(state_name).strip() if state_name else ""
             if state_name not in state_codes:
                 print(f"⚠️ State '{state_name}' not found in state_code_details.json, skipping row {row_num}")
-                row_num += 1
                 continue
 
             state_id = state_codes[state_name]["id"]
@@ -381,18 +347,9 @@ def extract_state_line_chart(excel_file):
                     state_line_chart_map[state_id]["line_chart"][2025]['Q4'] += float(q4)
                     state_line_chart_map[state_id]["line_chart"][2025]['valid_Q4'] = True
 
-            row_num += 1
-
-        workbook.close()
-
-        # Load GCP uploader
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
-
-        # Save & upload line-chart.json for each state
+        # Render line-chart.json for each state, then upload them as one batch
+        state_uploads = []
         for state_id, state_data in state_line_chart_map.items():
             line_chart_data = {
                 "data": []
@@ -408,13 +365,23 @@ def extract_state_line_chart(excel_file):
                         "data": data
                     })
             if line_chart_data["data"]:  # Save only if there is data
-                save_and_upload_state_file(script_dir, state_id, "line-chart.json", line_chart_data, gcp_access)
+                state_uploads.append(render_state_file(script_dir, state_id, "line-chart.json", line_chart_data))
+
+        result = storage.upload_many(state_uploads)
+        for _, key in state_uploads:
+            if result.succeeded(key):
+                print(f"✅ Uploaded {key}: {result.folder_url(key)}")
+            else:
+                print(f"❌ Failed to upload {key}: {result.failed[key]}")
 
-        print("✅ All line-chart.json files generated & uploaded successfully.")
-        extract_district_line_chart(excel_file)
+        if result.ok:
+            print("✅ All line-chart.json files generated & uploaded successfully.")
+        districts_ok = extract_district_line_chart(context)
+        return result.ok and districts_ok is not False
 
     except Exception as e:
         print(f"❌ Error: {str(e)}")
+        return False
 
 if __name__ == "__main__":
     import sys
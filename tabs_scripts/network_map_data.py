@@ -1,10 +1,10 @@
-import openpyxl
 import json
 import os
 import time
 from geopy.geocoders import Nominatim
 from constants import PAGE_METADATA, TABS_METADATA
-import importlib.util
+from tabs_scripts.workbook_context import as_workbook_context
+from tabs_scripts import storage
 
 # Initialize geolocator
 geolocator = Nominatim(user_agent="sgdashboard_network_mapper_v1.0")
@@ -63,7 +63,7 @@ def get_network_map_data(excel_file):
                 except json.JSONDecodeError:
                     print("⚠️ Existing JSON is invalid. Proceeding clean.")
 
-        workbook = openpyxl.load_workbook(excel_file, data_only=True)
+        workbook = as_workbook_context(excel_file).workbook
         try:
             sheet = workbook[PAGE_METADATA["NETWORK_MAP"]]
         except KeyError:
@@ -152,12 +152,6 @@ def get_network_map_data(excel_file):
         with open(json_path, 'w', encoding='utf-8') as f:
             json.dump(existing_data, f, indent=2, ensure_ascii=False)
 
-                     # Dynamically import gcp_access module and upload file
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
-
         # folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
         #     bucket_name="dev-sg-dashboard",
         #     source_file_path=json_path,
@@ -167,21 +161,22 @@ def get_network_map_data(excel_file):
         #     private_key_path=private_key_path
         # )
 
-        folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-            bucket_name=os.environ.get("BUCKET_NAME"),
+        folder_url = storage.upload_file(
             source_file_path=json_path,
-            destination_blob_name="sg-dashboard/network-data.json"
+            key="network-data.json"
         )
 
         if folder_url:
             print(f"Successfully uploaded and got public folder URL: {folder_url}")
         else:
             print("Failed to upload file to GCS. Check logs for details.")
+            return False
 
         print(f"✅ JSON exported successfully with {len(impact_data)} records to: {json_path}")
 
     except Exception as e:
         print(f"❌ Unexpected error: {str(e)}")
+        return False
 
 if __name__ == "__main__":
     excel_to_json()
\ No newline at end of file
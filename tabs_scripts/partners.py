@@ -1,53 +1,23 @@
-import openpyxl
 import json
 import os
 import re
-import requests
 from constants import PAGE_METADATA, TABS_METADATA
-import importlib.util
-
-
-def convert_drive_link_to_direct_url(link):
-    if not isinstance(link, str):
-        return ''
-    match = re.search(r"/d/([a-zA-Z0-9_-]+)", link)
-    if not match:
-        match = re.search(r"id=([a-zA-Z0-9_-]+)", link)
-    if match:
-        file_id = match.group(1)
-        return f"https://drive.google.com/uc?export=view&id={file_id}"
-    return link.strip()
-
-
-def download_image(file_id, save_path):
-    url = f"https://drive.google.com/uc?export=download&id={file_id}"
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(save_path, 'wb') as f:
-                f.write(response.content)
-            print(f"✅ Downloaded image to {save_path}")
-            return True
-        else:
-            print(f"❌ Failed to download image for file ID {file_id}")
-            return False
-    except Exception as e:
-        print(f"❌ Exception downloading image: {e}")
-        return False
-
-
+from tabs_scripts.workbook_context import as_workbook_context
+from tabs_scripts.drive import get_files_metadata
+from tabs_scripts.drive_images import drive_file_id
+from tabs_scripts.image_jobs import queue_drive_images, queue_sprite_sheets
+from tabs_scripts import storage
 
 
 def get_partners(excel_file):
+    published = True
     try:
         script_dir = os.path.dirname(os.path.abspath(__file__))
         json_path = os.path.join(script_dir, "..", "pages", "landing-page.json")
         network_data_path  = os.path.join(script_dir, "..", "pages", "network-data.json")
         network_health_json_path = os.path.join(script_dir, "..", "pages", "network-health.json")
-        images_dir = os.path.join(script_dir, "temp_downloads")
-        os.makedirs(images_dir, exist_ok=True)
 
-        workbook = openpyxl.load_workbook(excel_file, data_only=True)
+        workbook = as_workbook_context(excel_file).workbook
         try:
             sheet = workbook[PAGE_METADATA["PARTNERS"]]
         except KeyError:
@@ -66,6 +36,8 @@ def get_partners(excel_file):
 
         data = []
         allData = []
+        # (row_data, file_id) of logos, queued together after the sheet is read
+        logo_rows = []
         for row_idx, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
             try:
                 raw_name = row[headers.index(expected_columns[0])]
@@ -73,45 +45,15 @@ def get_partners(excel_file):
                     continue
 
                 raw_src = row[headers.index(expected_columns[1])] or ''
-                logo_url = convert_drive_link_to_direct_url(raw_src)
-
-                file_match = re.search(r"id=([a-zA-Z0-9_-]+)", logo_url)
-                if not file_match:
-                    file_match = re.search(r"/d/([a-zA-Z0-9_-]+)", raw_src)
-                file_id = file_match.group(1) if file_match else ''
+                file_id = drive_file_id(raw_src)
 
                 name_clean = str(raw_name).strip().lower()
                 name_clean = re.sub(r'[^a-z0-9_-]', '', name_clean.replace(" ", "_"))
-                local_filename = f"{name_clean}.jpg"
-                local_path = os.path.join(images_dir, local_filename)
-
-                if file_id:
-                    if download_image(file_id, local_path):
-
-                         gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-                         spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-                         gcp_access = importlib.util.module_from_spec(spec)
-                         spec.loader.exec_module(gcp_access)
-
-                         private_key_path = os.path.join(script_dir, "..", "private-key.json")
-
-                         folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-                            bucket_name=os.environ.get("BUCKET_NAME"),
-                            source_file_path=local_path,
-                            destination_blob_name=f"sg-dashboard/partners/{local_filename}"
-                         )
-
-                         if folder_url:
-                            os.remove(local_path)
-                            final_src = f"{folder_url.rstrip('/')}/{local_filename}"
-                            print(f"Successfully uploaded and got public folder URL: {folder_url}, {final_src}")
-                         else:
-                            print("Failed to upload file to GCS. Check logs for details.")
-
 
                 row_data = {
                     'id': name_clean,
-                    'src': final_src if final_src else '/assets/partners/default-partner.svg',
+                    # Replaced by the logo's published URL once the logos are queued
+                    'src': '/assets/partners/default-partner.svg',
                     'alt': name_clean,
                     'name': str(raw_name).strip(),
                     'countryName':row[headers.index(expected_columns[2])] or '',
@@ -126,18 +68,30 @@ def get_partners(excel_file):
 
 
                 allData.append(row_data)
+                if file_id:
+                    logo_rows.append((row_data, file_id))
 
                  # ✅ Skip if 'id' already exists
                 if any(p['id'] == name_clean for p in data):
                       print(f"⚠️ Skipping duplicate partner with id: {name_clean}")
                       continue
                 data.append(row_data)
-                final_src= ""
 
             except Exception as e:
                 print(f"⚠️ Error processing row {row_idx}: {e}")
                 continue
 
+        logo_ids = list(dict.fromkeys(file_id for _, file_id in logo_rows))
+        logo_metadata = get_files_metadata(logo_ids)
+        logo_urls = queue_drive_images(logo_ids, "logo", logo_metadata)
+        # The logo wall loads every logo from a few sprite sheets
+        logo_sprites = queue_sprite_sheets(logo_ids, "logo", logo_metadata)
+        for row_data, file_id in logo_rows:
+            if file_id in logo_urls:
+                row_data['src'] = logo_urls[file_id]['src']
+            if file_id in logo_sprites:
+                row_data['sprite'] = logo_sprites[file_id]
+
         if os.path.exists(json_path):
             with open(json_path, 'r', encoding='utf-8') as f:
                 try:
@@ -182,27 +136,21 @@ def get_partners(excel_file):
 
 
 
-            # Dynamically import gcp_access module and upload file
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
-
         # folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
         #     bucket_name="dev-sg-dashboard",
         #     source_file_path=json_path,
         #     destination_blob_name="sg-dashboard/landing-page.json",
         #     private_key_path=private_key_path
         # )
-        folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-            bucket_name=os.environ.get("BUCKET_NAME"),
+        folder_url = storage.upload_file(
             source_file_path=json_path,
-            destination_blob_name="sg-dashboard/landing-page.json"
+            key="landing-page.json"
         )
 
         if folder_url:
             print(f"Successfully uploaded and got public folder URL: {folder_url}")
         else:
+            published = False
             print("Failed to upload file to GCS. Check logs for details.")
 
         print("✅ landing-page.json updated.")
@@ -235,12 +183,6 @@ def get_partners(excel_file):
             json.dump(network_data, f, indent=2, ensure_ascii=False)
 
 
-                # Dynamically import gcp_access module and upload file
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
-
         # folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
         #     bucket_name="dev-sg-dashboard",
         #     source_file_path=json_path,
@@ -250,15 +192,15 @@ def get_partners(excel_file):
         #     private_key_path=private_key_path
         # )
 
-        folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-            bucket_name=os.environ.get("BUCKET_NAME"),
+        folder_url = storage.upload_file(
             source_file_path=network_data_path,
-            destination_blob_name="sg-dashboard/network-data.json"
+            key="network-data.json"
         )
 
         if folder_url:
             print(f"Successfully uploaded and got public folder URL: {folder_url}")
         else:
+            published = False
             print("Failed to upload file to GCS. Check logs for details.")
 
         print(f"✅ Added {len(allData)} partners to network-data.json (duplicates allowed).")
@@ -316,12 +258,6 @@ def get_partners(excel_file):
 
 
 
-                # Dynamically import gcp_access module and upload file
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
-
         # folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
         #     bucket_name="dev-sg-dashboard",
         #     source_file_path=json_path,
@@ -331,19 +267,21 @@ def get_partners(excel_file):
         #     private_key_path=private_key_path
         # )
 
-        folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-            bucket_name=os.environ.get("BUCKET_NAME"),
+        folder_url = storage.upload_file(
             source_file_path=network_health_json_path,
-            destination_blob_name="sg-dashboard/network-health.json"
+            key="network-health.json"
         )
 
         if folder_url:
             print(f"Successfully uploaded and got public folder URL: {folder_url}")
         else:
+            published = False
             print("Failed to upload file to GCS. Check logs for details.")
 
         print(f"✅ Added {len(allData)} partners to network-health.json.")
+        return published
 
     except Exception as e:
         print(f"❌ Unexpected error: {e}")
+        return False
 
@@ -1,9 +1,9 @@
-import openpyxl
 import json
 import os
-import importlib.util
 
 from constants import PAGE_METADATA,TABS_METADATA
+from tabs_scripts.workbook_context import as_workbook_context
+from tabs_scripts import storage
 
 
 def pie_chart(excel_file):
@@ -16,7 +16,7 @@ def pie_chart(excel_file):
 
 
         # Open the Excel file
-        workbook = openpyxl.load_workbook(excel_file, data_only=True)
+        workbook = as_workbook_context(excel_file).workbook
         try:
             sheet = workbook[PAGE_METADATA["DASHBOARD_FIRST_PAGE"]]
         except KeyError:
@@ -84,26 +84,22 @@ def pie_chart(excel_file):
         with open(json_path, 'w', encoding='utf-8') as json_file:
             json.dump(json_data, json_file, indent=2, ensure_ascii=False)
 
-        # Dynamically import gcp_access module and upload file
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
+        # Upload file
 
-
-        folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-            bucket_name=os.environ.get("BUCKET_NAME"),
+        folder_url = storage.upload_file(
             source_file_path=json_path,
-            destination_blob_name="sg-dashboard/dashboard.json"
+            key="dashboard.json"
         )
 
         if folder_url:
             print(f"Successfully uploaded and got public folder URL: {folder_url}")
         else:
             print("Failed to upload file to GCS. Check logs for details.")
+            return False
 
 
     except Exception as e:
         print(f"Error: {str(e)}")
+        return False
 
 
@@ -0,0 +1,293 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from constants import PAGE_METADATA
+from tabs_scripts.bundles import build_bundles
+from tabs_scripts.community_led_details import community_led_programs_sum_with_codes, pie_chart_community_led
+from tabs_scripts.extract_community_details import extract_community_details
+from tabs_scripts.extract_district_details import extract_district_details
+from tabs_scripts.extract_state_details import update_district_view_indicators
+from tabs_scripts.fingerprints import (
+    clear_group_fingerprints,
+    clear_remote_manifest,
+    load_sheet_fingerprints,
+    save_sheet_fingerprints,
+)
+from tabs_scripts.goals import goals
+from tabs_scripts.key_progress_indicators import key_progress_indicators
+from tabs_scripts.line_chart import extract_micro_improvements
+from tabs_scripts.network_map_data import get_network_map_data
+from tabs_scripts.partners import get_partners
+from tabs_scripts.pie_chart import pie_chart
+from tabs_scripts.programs import generate_program_reports
+from tabs_scripts.state_code_generator import state_code_generator
+from tabs_scripts.image_jobs import exhausted_images, resume_image_jobs, track_images, wait_for_image_jobs
+from tabs_scripts.storage import flush_mirror, outstanding_uploads, publish_release, resume_uploads
+from tabs_scripts.testimonials import testimonials
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+DEFAULT_MAX_WORKERS = int(os.environ.get("PIPELINE_MAX_WORKERS", "4"))
+
+
+class Stage:
+    """One extractor in the publish pipeline and where it sits in the graph.
+
+    `depends_on` stages must finish successfully first, and a stage re-runs
+    whenever one of them actually ran. `after` only orders two stages that
+    share a local page without implying a data dependency. `inputs` are the
+    workbook sheets the extractor reads; when none of them changed since the
+    last successful run the stage is skipped.
+    """
+
+    def __init__(self, name, func, depends_on=(), after=(), inputs=()):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.after = tuple(after)
+        self.inputs = tuple(inputs)
+        self.status = PENDING
+        self.error = None
+        self.elapsed = None
+        self.fingerprints = {}
+        # Image targets its pages reference before publishing, or leave out
+        self.images = {"planned": set(), "missing": set()}
+
+
+def build_publish_stages():
+    """Return the stages run for an uploaded workbook.
+
+    Besides the state code dependency, stages that read-modify-write the same
+    local JSON page (landing-page, network-data, network-health, dashboard,
+    states/{id}/map.json) keep the order they had when everything ran
+    sequentially. That is a real dependency where the later stage is the one
+    that publishes the shared result, and only an `after` edge otherwise.
+    """
+    sheets = PAGE_METADATA
+    return [
+        Stage("state_codes", state_code_generator, inputs=[sheets["STATE_DISTRICT_DETAILS"]]),
+        Stage("key_progress_indicators", key_progress_indicators, inputs=[sheets["HOME_PAGE"]]),
+        Stage("partners", get_partners, after=["key_progress_indicators"], inputs=[sheets["PARTNERS"]]),
+        Stage("network_map", get_network_map_data, after=["partners"], inputs=[sheets["NETWORK_MAP"]]),
+        Stage("testimonials", testimonials, after=["partners"], inputs=[sheets["TESTIMONIALS"]]),
+        Stage(
+            "state_details",
+            lambda context: update_district_view_indicators(context, generate_state_codes=False),
+            depends_on=["state_codes"],
+            inputs=[sheets["HOME_PAGE"], sheets["STATE_DETAILS"], sheets["STATE_DISTRICT_DETAILS"]]
+        ),
+        Stage(
+            "district_details",
+            extract_district_details,
+            depends_on=["state_codes", "state_details"],
+            inputs=[sheets["DISTRICT_DETAILS"], sheets["STATE_DISTRICT_DETAILS"]]
+        ),
+        # goals only writes dashboard.json locally; pie_chart uploads it, and
+        # micro_improvements uploads it again with its line-chart section
+        Stage("goals", goals, inputs=[sheets["GOALS"]]),
+        Stage("pie_chart", pie_chart, depends_on=["goals"], inputs=[sheets["DASHBOARD_FIRST_PAGE"]]),
+        Stage(
+            "micro_improvements",
+            extract_micro_improvements,
+            depends_on=["state_codes"],
+            after=["pie_chart"],
+            inputs=[sheets["MICRO_IMPROVEMENTS"], sheets["STATE_DISTRICT_DETAILS"]]
+        ),
+        Stage("community_led_pie_chart", pie_chart_community_led, inputs=[sheets["COMMUNITY_LED_PROGRAMS"]]),
+        Stage(
+            "community_country_view",
+            community_led_programs_sum_with_codes,
+            inputs=[sheets["COMMUNITY_LED_PROGRAMS"], sheets["STATE_DISTRICT_DETAILS"]]
+        ),
+        Stage(
+            "programs",
+            generate_program_reports,
+            depends_on=["state_codes"],
+            inputs=[sheets["PROGRAMS"], sheets["STATE_DISTRICT_DETAILS"]]
+        ),
+        Stage(
+            "community_details",
+            extract_community_details,
+            depends_on=["state_codes"],
+            inputs=[sheets["COMMUNITY_LED_PROGRAMS"], sheets["STATE_DISTRICT_DETAILS"]]
+        ),
+        # No input sheets, so it runs every time; it only uploads bundles whose
+        # entity files changed
+        Stage(
+            "bundles",
+            build_bundles,
+            depends_on=["state_details", "district_details", "micro_improvements", "programs", "community_details"]
+        ),
+    ]
+
+
+def _check_graph(stages):
+    by_name = {stage.name: stage for stage in stages}
+    if len(by_name) != len(stages):
+        raise ValueError("Stage names must be unique")
+
+    for stage in stages:
+        unknown = [dep for dep in stage.depends_on + stage.after if dep not in by_name]
+        if unknown:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {unknown}")
+
+    # Depth-first walk to reject cycles before anything is submitted
+    visiting, visited = set(), set()
+
+    def visit(name):
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle through stage '{name}'")
+        visiting.add(name)
+        for dep in by_name[name].depends_on + by_name[name].after:
+            visit(dep)
+        visiting.discard(name)
+        visited.add(name)
+
+    for stage in stages:
+        visit(stage.name)
+    return by_name
+
+
+def _run_stage(stage, context, previous, force):
+    started = time.monotonic()
+    try:
+        stage.fingerprints = {sheet: context.sheet_fingerprint(sheet) for sheet in stage.inputs}
+        unchanged = (
+            stage.inputs
+            and None not in stage.fingerprints.values()
+            and previous.get(stage.name) == stage.fingerprints
+        )
+        if unchanged and not force:
+            return SKIPPED
+        # Extractors return False when an upload failed or their catch-all
+        # handler fired, so the stage is retried on the next run; a bare
+        # return is only used for a missing sheet or column
+        with track_images() as stage.images:
+            ok = stage.func(context)
+        if ok is False:
+            raise RuntimeError("some files failed to publish")
+        return DONE
+    finally:
+        stage.elapsed = time.monotonic() - started
+
+
+def run_pipeline(stages, context, max_workers=DEFAULT_MAX_WORKERS, on_status=None, skip_unchanged=True):
+    """Run `stages` concurrently, starting each once its predecessors are done.
+
+    `on_status(stage)` is called from the calling thread whenever a stage
+    changes state, so it is safe to update Streamlit elements from it. A
+    stage whose dependency failed is marked blocked and never started. With
+    skip_unchanged, a stage whose input sheets hash the same as on its last
+    successful run (and none of whose dependencies ran) is skipped; the
+    hashes are saved for every stage that completes. Without it, the
+    per-state/district row hashes are dropped too so every artifact is
+    rebuilt, and the remote object hashes so each upload is re-checked
+    against the bucket. Uploads left in the publish journal by an earlier
+    run are retried before any stage starts. Drive images are published by
+    background workers while the stages run (see image_jobs), and the run
+    ends once they are done; stages whose pages point at an image that ran
+    out of attempts are rendered again without it, and a stage rendered
+    without some images is not skipped next time. In hashed publish mode the run's objects go live
+    together, and only if no stage failed or was blocked.
+    Returns the stages with their final status, error and elapsed time.
+    """
+    by_name = _check_graph(stages)
+    previous = load_sheet_fingerprints() if skip_unchanged else {}
+    if not skip_unchanged:
+        clear_group_fingerprints()
+        clear_remote_manifest()
+    # Uploads an interrupted or failed run never finished go out first
+    resume_uploads()
+    resume_image_jobs()
+
+    def notify(stage):
+        if on_status:
+            on_status(stage)
+
+    def schedule(pending, always_force=False):
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while pending or running:
+                for stage in list(pending.values()):
+                    deps = [by_name[dep] for dep in stage.depends_on]
+                    predecessors = deps + [by_name[dep] for dep in stage.after]
+                    if any(dep.status in (FAILED, BLOCKED) for dep in deps):
+                        stage.status = BLOCKED
+                        del pending[stage.name]
+                        notify(stage)
+                    elif all(dep.status not in (PENDING, RUNNING) for dep in predecessors):
+                        force = always_force or not skip_unchanged or any(dep.status == DONE for dep in deps)
+                        stage.status = RUNNING
+                        del pending[stage.name]
+                        running[pool.submit(_run_stage, stage, context, previous, force)] = stage
+                        notify(stage)
+
+                if not running:
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    try:
+                        stage.status = future.result()
+                    except BaseException as e:
+                        stage.status = FAILED
+                        stage.error = e
+                        print(f"❌ Stage '{stage.name}' failed: {e}")
+                    notify(stage)
+
+    schedule(dict(by_name))
+
+    # Local mirror copies are written in the background while stages upload
+    flush_mirror()
+    # Pages already point at the images' URLs; failed image jobs stay queued
+    wait_for_image_jobs()
+    # A page written against an image that then ran out of attempts would
+    # point at a missing object: render those stages (and the ones built from
+    # them) again, so the page falls back to its default for that image
+    rerun = {stage.name: stage for stage in stages if stage.status == DONE and exhausted_images(stage.images["planned"])}
+    for stage in stages:
+        if stage.status == DONE and any(dep in rerun for dep in stage.depends_on):
+            rerun[stage.name] = stage
+    if rerun:
+        print(f"🔁 Rendering {', '.join(rerun)} again without the images that failed")
+        for stage in rerun.values():
+            stage.status = PENDING
+            notify(stage)
+        schedule(rerun, always_force=True)
+        flush_mirror()
+
+    # In hashed mode nothing is visible until the release flips, and only a
+    # run where every stage succeeded and no upload is outstanding may flip it
+    publish_release(
+        complete=not any(stage.status in (FAILED, BLOCKED) for stage in stages) and not outstanding_uploads()
+    )
+
+    fingerprints = load_sheet_fingerprints()
+    for stage in stages:
+        if stage.images["missing"]:
+            # Rendered without some images; render it again once they are published
+            fingerprints.pop(stage.name, None)
+        elif stage.status == DONE and stage.inputs and None not in stage.fingerprints.values():
+            fingerprints[stage.name] = stage.fingerprints
+        elif stage.status in (FAILED, BLOCKED):
+            fingerprints.pop(stage.name, None)
+    save_sheet_fingerprints(fingerprints)
+
+    return stages
+
+
+def summarize_run(stages):
+    """Group stage names by final status for the run summary."""
+    summary = {}
+    for stage in stages:
+        summary.setdefault(stage.status, []).append(stage.name)
+    return summary
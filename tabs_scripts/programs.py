@@ -1,37 +1,13 @@
-import openpyxl
 import json
 import os
 import re
-import io
 from difflib import get_close_matches
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
 from constants import PAGE_METADATA, TABS_METADATA
-import importlib.util
-from dotenv import load_dotenv
-
-load_dotenv()
-
-SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
-
-service_account_info = {
-    "type": os.getenv("TYPE"),
-    "project_id": os.getenv("PROJECT_ID"),
-    "private_key_id": os.getenv("PRIVATE_KEY_ID"),
-    "private_key": os.getenv("PRIVATE_KEY").replace('\\n', '\n'),
-    "client_email": os.getenv("CLIENT_EMAIL"),
-    "auth_uri": os.getenv("AUTH_URI"),
-    "token_uri": os.getenv("TOKEN_URI"),
-    "auth_provider_x509_cert_url": os.getenv("AUTH_PROVIDER_X509_CERT_URL"),
-    "client_x509_cert_url": os.getenv("CLIENT_X509_CERT_URL"),
-    "universe_domain": os.getenv("UNIVERSE_DOMAIN"),
-}
-
-credentials = service_account.Credentials.from_service_account_info(
-    service_account_info, scopes=SCOPES
-)
-drive_service = build('drive', 'v3', credentials=credentials)
+from tabs_scripts.workbook_context import as_workbook_context
+from tabs_scripts.drive import MAX_PICTURE_BYTES, FolderListings
+from tabs_scripts.fingerprints import GroupFingerprints
+from tabs_scripts.image_jobs import queue_folder_images, track_images
+from tabs_scripts import storage
 
 
 def normalize(text):
@@ -50,66 +26,17 @@ def extract_folder_id(drive_url):
     return match.group(1) if match else None
 
 
-def download_file(file_id, output_dir):
-    try:
-        file_metadata = drive_service.files().get(fileId=file_id).execute()
-        filename = file_metadata.get('name')
-        request = drive_service.files().get_media(fileId=file_id)
-        os.makedirs(output_dir, exist_ok=True)
-        file_path = os.path.join(output_dir, filename)
-        with io.FileIO(file_path, 'wb') as fh:
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while not done:
-                _, done = downloader.next_chunk()
-        return file_path
-    except Exception as e:
-        print(f"❌ Failed to download file {file_id}: {e}")
-        return None
-
-
-def download_folder_images(folder_id, output_dir, program_type):
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-    spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-    gcp_access = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(gcp_access)
-
-    bucket_name = os.environ.get("BUCKET_NAME")
-    logo_urls = []
-    page_token = None
-
-    while True:
-        response = drive_service.files().list(
-            q=f"'{folder_id}' in parents and mimeType contains 'image/'",
-            spaces='drive',
-            fields='nextPageToken, files(id, name)',
-            pageToken=page_token
-        ).execute()
-
-        for file in response.get('files', []):
-            local_file = download_file(file['id'], output_dir)
-            if local_file:
-                local_filename = os.path.basename(local_file)
-                destination_blob = f"sg-dashboard/partners/{program_type}/{local_filename}"
-                folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-                    bucket_name=bucket_name,
-                    source_file_path=local_file,
-                    destination_blob_name=destination_blob
-                )
-                if folder_url:
-                    os.remove(local_file)
-                    final_url = f"{folder_url.rstrip('/')}/{local_filename}"
-                    logo_urls.append(final_url)
-                    print(f"✅ Uploaded {local_filename} → {final_url}")
-                else:
-                    print(f"❌ Failed to upload {local_filename} to GCS")
-
-        page_token = response.get('nextPageToken')
-        if not page_token:
-            break
+def queue_folder_pictures(folder_id, listings):
+    """Queue a Drive folder's pictures for publishing; returns {rendition: URL} per picture, in listing order."""
+    files = []
+    for file in listings.images(folder_id):
+        if int(file.get('size') or 0) > MAX_PICTURE_BYTES:
+            print(f"⚠️ Skipping {file['name']}: larger than {MAX_PICTURE_BYTES} bytes")
+            continue
+        files.append(file)
 
-    return logo_urls
+    picture_urls = queue_folder_images(files, "photo")
+    return [picture_urls[file['id']] for file in files if file['id'] in picture_urls]
 
 
 def build_lookup(state_code_map):
@@ -148,8 +75,6 @@ def resolve_codes(state, district, lookup, district_index):
 def generate_program_reports(excel_file):
     try:
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        base_images_dir = os.path.join(script_dir, 'tmp_images')
-        os.makedirs(base_images_dir, exist_ok=True)
 
         # Load state code mapping
         state_code_path = os.path.join(script_dir, '..', "pages", 'state_code_details.json')
@@ -158,7 +83,7 @@ def generate_program_reports(excel_file):
 
         district_lookup, district_index = build_lookup(state_code_map)
 
-        workbook = openpyxl.load_workbook(excel_file, data_only=True)
+        workbook = as_workbook_context(excel_file).workbook
         sheet = workbook[PAGE_METADATA["PROGRAMS"]]
 
         headers = [str(cell.value).strip() if cell.value else '' for cell in sheet[1]]
@@ -169,11 +94,10 @@ def generate_program_reports(excel_file):
         state_data = {}
         state_wlc_data = {} 
 
-        gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-        spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-        gcp_access = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(gcp_access)
-        bucket_name = os.environ.get("BUCKET_NAME")
+        # Row hashes per output file, so only changed programs lists (and
+        # their picture folders) are rebuilt
+        row_groups = GroupFingerprints("programs")
+        row_entries = []
 
         for row in sheet.iter_rows(min_row=2, values_only=True):
             row_dict = {snake_case(col): row[header_index_map.get(col)] if header_index_map.get(col) is not None else '' 
@@ -193,16 +117,6 @@ def generate_program_reports(excel_file):
             # Use state id from JSON if available
             state_code = state_code_map.get(state, {}).get("id", state_code or normalize(state))
 
-            folder_url = row_dict.get('pictures_from_the_program', '')
-            logo_urls = []
-            if folder_url:
-                folder_id = extract_folder_id(folder_url)
-                if folder_id:
-                    program_folder = os.path.join(base_images_dir, f"{program.replace(' ', '_').lower()}")
-                    os.makedirs(program_folder, exist_ok=True)
-                    logo_urls = download_folder_images(folder_id, program_folder, program_type)
-            row_dict['logo_urls'] = logo_urls
-
             # Convert partner field to array
             partner_key = 'name_of_the_partner_leading_the_program'
             if partner_key in row_dict:
@@ -218,82 +132,104 @@ def generate_program_reports(excel_file):
             # Add to state-level or district-level JSON
             if is_state_level or not district_code:
                 state_data.setdefault(str(state_code), []).append(row_dict)
+                group_keys = [f"states/{state_code}/state-program"]
             else:
                 district_data[program_type].setdefault(str(district_code), []).append(row_dict)
+                group_keys = [f"districts/{district_code}/{program_type}"]
                 if program_type == "WLC":
                     state_wlc_data.setdefault(str(state_code), []).append(row_dict)  # <-- Collect WLC per state
+                    group_keys.append(f"states/{state_code}/WLC")
+
+            for key in group_keys:
+                row_groups.add(key, row_dict)
+            row_entries.append((row_dict, program, program_type, group_keys))
+
+        # Program pictures are only queued for rows whose output file changed.
+        # Files rendered before their pictures were published are not marked
+        # published, so they are rendered again (with the published URLs, or
+        # without pictures that failed)
+        listings = None
+        unsettled = set()
+        for row_dict, program, program_type, group_keys in row_entries:
+            if not any(row_groups.changed(key) for key in group_keys):
+                continue
 
-        # District-level JSONs
+            folder_url = row_dict.get('pictures_from_the_program', '')
+            pictures = []
+            if folder_url:
+                folder_id = extract_folder_id(folder_url)
+                if folder_id:
+                    if listings is None:
+                        listings = FolderListings()
+                    with track_images() as images:
+                        pictures = queue_folder_pictures(folder_id, listings)
+                    if images["planned"] or images["missing"]:
+                        unsettled.update(group_keys)
+            row_dict['logo_urls'] = [urls['src'] for urls in pictures]
+            row_dict['thumbnail_urls'] = [urls.get('thumbnail', urls['src']) for urls in pictures]
+        if listings is not None:
+            listings.save()
+
+        # Files to publish, keyed by their row group (one file per group)
+        group_uploads = {}
+
+        # District-level JSONs (rendered in memory, mirrored locally in the background)
         districts_dir = os.path.join(script_dir, '..', 'districts')
-        os.makedirs(districts_dir, exist_ok=True)
 
         for category_name, data_dict in district_data.items():
             for district_code, programs in data_dict.items():
-                district_folder = os.path.join(districts_dir, str(district_code))
-                os.makedirs(district_folder, exist_ok=True)
-                out_file = os.path.join(district_folder, f"{category_name}.json")
-                with open(out_file, 'w', encoding='utf-8') as f:
-                    json.dump(programs, f, indent=2, ensure_ascii=False)
-                print(f"✅ Saved {category_name}.json for district {district_code} at {out_file}")
-
-                gcs_path = f"sg-dashboard/districts/{district_code}/{category_name}.json"
-                folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-                    bucket_name=bucket_name,
-                    source_file_path=out_file,
-                    destination_blob_name=gcs_path
-                )
-                if folder_url:
-                    print(f"✅ Uploaded {category_name}.json for district {district_code} to {folder_url}")
-                else:
-                    print(f"❌ Failed to upload {category_name}.json for district {district_code}")
+                group_key = f"districts/{district_code}/{category_name}"
+                if not row_groups.changed(group_key):
+                    continue
+
+                content = storage.render_json(programs)
+                storage.mirror_file(os.path.join(districts_dir, str(district_code), f"{category_name}.json"), content)
+                print(f"✅ Rendered {category_name}.json for district {district_code}")
+
+                group_uploads[group_key] = (content, f"districts/{district_code}/{category_name}.json")
 
         # State-level JSONs
         states_dir = os.path.join(script_dir, '..', 'states')
-        os.makedirs(states_dir, exist_ok=True)
 
         for state_code, programs in state_data.items():
-            state_folder = os.path.join(states_dir, str(state_code))
-            os.makedirs(state_folder, exist_ok=True)
-            out_file = os.path.join(state_folder, "state-program.json")
-            with open(out_file, 'w', encoding='utf-8') as f:
-                json.dump(programs, f, indent=2, ensure_ascii=False)
-            print(f"✅ Saved state-program.json for state {state_code} at {out_file}")
-
-            gcs_path = f"sg-dashboard/states/{state_code}/state-program.json"
-            folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-                bucket_name=bucket_name,
-                source_file_path=out_file,
-                destination_blob_name=gcs_path
-            )
-            if folder_url:
-                print(f"✅ Uploaded state-program.json for state {state_code} to {folder_url}")
-            else:
-                print(f"❌ Failed to upload state-program.json for state {state_code}")
+            group_key = f"states/{state_code}/state-program"
+            if not row_groups.changed(group_key):
+                continue
+
+            content = storage.render_json(programs)
+            storage.mirror_file(os.path.join(states_dir, str(state_code), "state-program.json"), content)
+            print(f"✅ Rendered state-program.json for state {state_code}")
+
+            group_uploads[group_key] = (content, f"states/{state_code}/state-program.json")
 
         # NEW: State-level WLC.json
         for state_code, wlc_programs in state_wlc_data.items():
-            state_folder = os.path.join(states_dir, str(state_code))
-            os.makedirs(state_folder, exist_ok=True)
-            out_file = os.path.join(state_folder, "WLC.json")
-            with open(out_file, 'w', encoding='utf-8') as f:
-                json.dump(wlc_programs, f, indent=2, ensure_ascii=False)
-            print(f"✅ Saved WLC.json for state {state_code} at {out_file}")
-
-            gcs_path = f"sg-dashboard/states/{state_code}/WLC.json"
-            folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-                bucket_name=bucket_name,
-                source_file_path=out_file,
-                destination_blob_name=gcs_path
-            )
-            if folder_url:
-                print(f"✅ Uploaded WLC.json for state {state_code} to {folder_url}")
+            group_key = f"states/{state_code}/WLC"
+            if not row_groups.changed(group_key):
+                continue
+
+            content = storage.render_json(wlc_programs)
+            storage.mirror_file(os.path.join(states_dir, str(state_code), "WLC.json"), content)
+            print(f"✅ Rendered WLC.json for state {state_code}")
+
+            group_uploads[group_key] = (content, f"states/{state_code}/WLC.json")
+
+        result = storage.upload_many(group_uploads.values())
+        for group_key, (_, key) in group_uploads.items():
+            if result.succeeded(key):
+                print(f"✅ Uploaded {key} to {result.folder_url(key)}")
+                if group_key not in unsettled:
+                    row_groups.mark_published(group_key)
             else:
-                print(f"❌ Failed to upload WLC.json for state {state_code}")
+                print(f"❌ Failed to upload {key}: {result.failed[key]}")
 
+        row_groups.save()
         print("✅ Program reports generated successfully.")
+        return result.ok
 
     except Exception as e:
         print(f"❌ Fatal Error: {e}")
+        return False
 
 
 if __name__ == "__main__":
@@ -0,0 +1,58 @@
+from operator import itemgetter
+
+
+def read_headers(sheet, header_row=1):
+    """Return the stripped header strings found on `header_row`."""
+    for row in sheet.iter_rows(min_row=header_row, max_row=header_row, values_only=True):
+        return [str(value).strip() if value is not None else '' for value in row]
+    return []
+
+
+def resolve_columns(headers, expected_headers, case_insensitive=False):
+    """Map each expected header to its 0-based position in `headers`.
+
+    Returns (column_indices, missing_columns). With case_insensitive=True the
+    comparison ignores case, but the returned keys keep the spelling used in
+    `expected_headers` (e.g. the TABS_METADATA entry).
+    """
+    positions = {}
+    for idx, header in enumerate(headers):
+        key = header.lower() if case_insensitive else header
+        if key and key not in positions:
+            positions[key] = idx
+
+    column_indices = {}
+    missing_columns = []
+    for header in expected_headers:
+        key = header.strip().lower() if case_insensitive else header.strip()
+        if key in positions:
+            column_indices[header] = positions[key]
+        else:
+            missing_columns.append(header)
+    return column_indices, missing_columns
+
+
+def iter_projected_rows(sheet, columns, min_row=2, stop_when_empty=()):
+    """Yield a tuple per data row holding only the values at `columns`.
+
+    `columns` are 0-based sheet positions and the tuple follows their order.
+    Rows are streamed once with values_only iteration, so this works on
+    read-only worksheets without random cell access. Iteration ends at the
+    first row where every column listed in `stop_when_empty` is blank, which
+    is where the contiguous data block of a tab ends.
+    """
+    columns = list(columns)
+    if not columns:
+        return
+
+    if len(columns) == 1:
+        only = columns[0]
+        project = lambda row: (row[only],)
+    else:
+        project = itemgetter(*columns)
+
+    max_col = max(columns + list(stop_when_empty)) + 1
+    for row in sheet.iter_rows(min_row=min_row, max_col=max_col, values_only=True):
+        if stop_when_empty and not any(row[idx] for idx in stop_when_empty):
+            break
+        yield project(row)
@@ -1,11 +1,13 @@
-import openpyxl
 import json
 import os
 from constants import PAGE_METADATA, TABS_METADATA
-import importlib.util
+from tabs_scripts.workbook_context import as_workbook_context
+from tabs_scripts.sheet_reader import iter_projected_rows, read_headers, resolve_columns
+from tabs_scripts import storage
 
 
 def state_code_generator(excel_file):
+    published = True
     try:
         # Get the script directory and file path
         script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -16,7 +18,7 @@ def state_code_generator(excel_file):
         #     return
         
         # Load workbook
-        workbook = openpyxl.load_workbook(excel_file, data_only=True)
+        workbook = as_workbook_context(excel_file).workbook
         print(f"WORKBOOK IN STATEGEN {workbook.sheetnames}")
         try:
             sheet = workbook[PAGE_METADATA["STATE_DISTRICT_DETAILS"]]
@@ -30,22 +32,12 @@ def state_code_generator(excel_file):
         print(f"Expected headers: {expected_headers}")
         
         # Read headers from the first row to find column indices
-        header_row = 1
-        column_indices = {}
-        
-        for cell in sheet[header_row]:
-            if cell.value and cell.value.lower().strip() in [h.lower() for h in expected_headers]:
-                for header in expected_headers:
-                    if cell.value.lower().strip() == header.lower():
-                        column_indices[header] = cell.column
-                        break
+        column_indices, missing_columns = resolve_columns(
+            read_headers(sheet), expected_headers, case_insensitive=True
+        )
         
         print(f"Found column indices: {column_indices}")
         
-        # Verify we have the required columns
-        required_columns = TABS_METADATA["STATE_DISTRICT_DETAILS"]
-        missing_columns = [col for col in required_columns if col not in column_indices]
-        
         if missing_columns:
             print(f"Error: Missing required columns: {missing_columns}")
             return
@@ -54,23 +46,18 @@ def state_code_generator(excel_file):
         json_data = {}
         
         # Start from row 2 (assuming row 1 has headers)
-        row_num = 2
         processed_count = 0
         
-        while True:
-            state_name_cell = sheet.cell(row=row_num, column=column_indices["state name"])
-            district_name_cell = sheet.cell(row=row_num, column=column_indices["district name"])
-            state_code_cell = sheet.cell(row=row_num, column=column_indices["state code"])
-            district_code_cell = sheet.cell(row=row_num, column=column_indices["district code"])
-            
-            # Check if we've reached the end of data
-            if not state_name_cell.value:
-                break
-            
-            state_name = str(state_name_cell.value).strip()
-            district_name = str(district_name_cell.value).strip() if district_name_cell.value else None
-            state_code = str(state_code_cell.value).strip() if state_code_cell.value else None
-            district_code = str(district_code_cell.value).strip() if district_code_cell.value else None
+        rows = iter_projected_rows(
+            sheet,
+            [column_indices[header] for header in expected_headers],
+            stop_when_empty=(column_indices["state name"],)
+        )
+        for state_name, district_name, state_code, district_code in rows:
+            state_name = str(state_name).strip()
+            district_name = str(district_name).strip() if district_name else None
+            state_code = str(state_code).strip() if state_code else None
+            district_code = str(district_code).strip() if district_code else None
             
             if state_name not in json_data:
                 json_data[state_name] = {"id": state_code}
@@ -80,7 +67,6 @@ def state_code_generator(excel_file):
                 json_data[state_name][district_name] = district_code
             
             processed_count += 1
-            row_num += 1
         
         print(f"Processed {processed_count} rows, found {len(json_data)} states")
         
@@ -93,48 +79,44 @@ def state_code_generator(excel_file):
             with open(output_file, 'w', encoding='utf-8') as json_file:
                 json.dump(json_data, json_file, indent=4, ensure_ascii=False)
 
-            gcp_access_path = os.path.join(script_dir, '..', 'cloud-scripts', 'gcp_access.py')
-            spec = importlib.util.spec_from_file_location('gcp_access', gcp_access_path)
-            gcp_access = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(gcp_access)
-
             private_key_path = os.path.join(script_dir, "..", "private-key.json")
 
-            folder_url = gcp_access.upload_file_to_gcs_and_get_directory(
-                bucket_name=os.environ.get("BUCKET_NAME"),
+            folder_url = storage.upload_file(
                 source_file_path=output_file,
-                destination_blob_name="sg-dashboard/state_code_details.json"
+                key="state_code_details.json"
             )
 
             if folder_url:
                 print(f"Successfully uploaded and got public folder URL state code gen: {folder_url}")
             else:
+                published = False
                 print("Failed to upload file to GCS. Check logs for details.")
 
-            folder_url_for_india_json = gcp_access.upload_file_to_gcs_and_get_directory(
-                bucket_name=os.environ.get("BUCKET_NAME"),
+            folder_url_for_india_json = storage.upload_file(
                 source_file_path=india_json_file,
-                destination_blob_name="sg-dashboard/india.json"
+                key="india.json"
             )
 
             if folder_url_for_india_json:
                 print(f"Successfully uploaded and got public folder URL: {folder_url_for_india_json}")
             else:
+                published = False
                 print("Failed to upload file to GCS. Check logs for details.")
 
             
             print(f"Successfully created {output_file}")
+            return published
                     
         except Exception as e:
             print(f"Error writing to JSON file: {str(e)}")
-        
-        # Close workbook
-        workbook.close()
+            return False
         
     except FileNotFoundError:
         print(f"Error: Excel file not found at {file_path}")
+        return False
     except Exception as e:
         print(f"Error: {str(e)}")
+        return False
 
 
 if __name__ == "__main__":
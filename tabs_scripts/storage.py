@@ -0,0 +1,475 @@
+import hashlib
+import json
+import os
+import posixpath
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+from tabs_scripts.fingerprints import (
+    STAGED_RELEASE_PATH,
+    clear_group_fingerprints,
+    load_json_state,
+    save_json_state,
+    save_sheet_fingerprints,
+)
+from tabs_scripts.journal import PublishJournal
+
+# Configuration (environment / .env):
+#   STORAGE_BACKEND        "gcs" (default) or "local"
+#   STORAGE_PREFIX         folder every key is published under (default "sg-dashboard")
+#   BUCKET_NAME            bucket used by the gcs backend
+#   LOCAL_STORAGE_DIR      root directory used by the local backend
+#   LOCAL_STORAGE_BASE_URL URL the local root is served from (default: file:// URL of the root)
+#   LOCAL_MIRROR           "0" stops mirroring per-entity JSON into states/ and districts/
+#   PUBLISH_MODE           "direct" (default) publishes each key in place; "hashed"
+#                          publishes it under _v/<content hash>/ and releases it through manifest.json
+#   STORAGE_CACHE_CONTROL  Cache-Control of objects published in place
+DEFAULT_PREFIX = "sg-dashboard"
+DEFAULT_LOCAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "published")
+MIRROR_ENABLED = os.environ.get("LOCAL_MIRROR", "1") != "0"
+
+DIRECT = "direct"
+HASHED = "hashed"
+PUBLISH_MODE = os.environ.get("PUBLISH_MODE", DIRECT).strip().lower()
+MANIFEST_KEY = "manifest.json"
+RELEASES_DIR = "releases"
+VERSIONED_DIR = "_v"
+# Objects whose name changes with their content can be cached forever; the
+# manifest and in-place objects are revalidated within a minute
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MANIFEST_CACHE_CONTROL = "public, max-age=60"
+DEFAULT_CACHE_CONTROL = os.environ.get("STORAGE_CACHE_CONTROL", "public, max-age=60")
+
+
+class PublishResult:
+    """Outcome of StorageBackend.upload_many, keyed by storage key."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.uploaded = []
+        self.skipped = []
+        self.failed = {}
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    def succeeded(self, key):
+        return key not in self.failed
+
+    def folder_url(self, key):
+        return self.backend.folder_url(key)
+
+    def __repr__(self):
+        return (f"PublishResult(uploaded={len(self.uploaded)}, "
+                f"skipped={len(self.skipped)}, failed={len(self.failed)})")
+
+
+def read_source(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+class StorageBackend:
+    """Where rendered pages and assets are published.
+
+    Extractors address objects by key, a path relative to the dashboard root
+    such as "states/AS/map.json"; the backend prepends its prefix. Sources
+    are a local file path or bytes.
+
+    In hashed mode a key is stored as "_v/<content hash>/<key>" with an
+    immutable Cache-Control and nothing readers see changes until
+    publish_release(): that writes releases/<id>.json, mapping every key to
+    its stored key, and then points manifest.json (short TTL) at it in a
+    single write. Hashed objects are never overwritten, so the previous
+    release stays intact for rollback_release(). URLs returned for a key
+    point at the hashed object, so image links written into pages never go
+    stale.
+    """
+
+    def __init__(self, prefix=DEFAULT_PREFIX, mode=DIRECT):
+        if mode not in (DIRECT, HASHED):
+            raise ValueError(f"Unknown PUBLISH_MODE: {mode}")
+        self.prefix = (prefix or "").strip("/")
+        self.mode = mode
+        self.manifest = {}
+        self._manifest_lock = threading.Lock()
+
+    def object_name(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def stored_key(self, key, data):
+        """Key `data` is stored under: `key` itself, or its content-hashed version."""
+        if self.mode != HASHED:
+            return key
+        return f"{VERSIONED_DIR}/{hashlib.sha256(data).hexdigest()[:16]}/{key}"
+
+    def resolve(self, key):
+        with self._manifest_lock:
+            return self.manifest.get(key, key)
+
+    def cache_control(self):
+        return IMMUTABLE_CACHE_CONTROL if self.mode == HASHED else DEFAULT_CACHE_CONTROL
+
+    def base_url(self):
+        raise NotImplementedError
+
+    def public_url(self, key):
+        return f"{self.base_url()}/{self.object_name(self.resolve(key))}"
+
+    def folder_url(self, key):
+        """URL of the folder holding `key`, as upload_file_to_gcs_and_get_directory returned."""
+        return f"{self.base_url()}/{posixpath.dirname(self.object_name(self.resolve(key)))}"
+
+    def _put(self, source, stored_key, cache_control):
+        """Store `source` under `stored_key`; return False if it was already identical. Raises on failure."""
+        raise NotImplementedError
+
+    def read(self, key):
+        """Return the stored bytes of `key` (not resolved through the manifest), or None."""
+        raise NotImplementedError
+
+    def _record(self, key, stored_key):
+        if self.mode == HASHED:
+            with self._manifest_lock:
+                self.manifest[key] = stored_key
+
+    def publish(self, source, key):
+        """Store `source` under `key`; return False if it was already identical. Raises on failure."""
+        if self.mode != HASHED:
+            return self._put(source, key, self.cache_control())
+        data = read_source(source)
+        stored_key = self.stored_key(key, data)
+        changed = self._put(data, stored_key, self.cache_control())
+        self._record(key, stored_key)
+        return changed
+
+    def read_json(self, key):
+        data = self.read(key)
+        return json.loads(data) if data else None
+
+    def publish_release(self, complete=True):
+        """Release this run's objects in hashed mode; returns the live release id.
+
+        Stored keys are staged in the publish cache first, so objects of a
+        run that is not `complete` (some stage failed) are carried into the
+        next release instead of going live with part of the tree. A complete
+        run merges them over the live release and flips manifest.json.
+        Returns None when nothing was released.
+        """
+        if self.mode != HASHED:
+            return None
+        staged = load_json_state(STAGED_RELEASE_PATH, {})
+        with self._manifest_lock:
+            staged.update(self.manifest)
+            self.manifest.clear()
+        save_json_state(STAGED_RELEASE_PATH, staged)
+        if not complete:
+            print(f"⚠️ Publish incomplete; {len(staged)} staged files wait for the next release")
+            return None
+
+        current = self.read_json(MANIFEST_KEY) or {}
+        files = dict(current.get("files", {}))
+        files.update(staged)
+        if current and files == current.get("files"):
+            os.remove(STAGED_RELEASE_PATH)
+            return current.get("release")
+
+        files = dict(sorted(files.items()))
+        digest = hashlib.sha256(render_json(files)).hexdigest()[:8]
+        release_id = f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{digest}"
+        data = render_json({"release": release_id, "previous": current.get("release"), "files": files})
+        # The release file first, so the pointer never names a missing release
+        self._put(data, f"{RELEASES_DIR}/{release_id}.json", IMMUTABLE_CACHE_CONTROL)
+        self._put(data, MANIFEST_KEY, MANIFEST_CACHE_CONTROL)
+        os.remove(STAGED_RELEASE_PATH)
+        return release_id
+
+    def rollback_release(self):
+        """Point manifest.json back at the release before the live one; returns its id."""
+        current = self.read_json(MANIFEST_KEY) or {}
+        previous = current.get("previous")
+        if not previous:
+            raise ValueError("There is no earlier release to roll back to")
+        data = self.read(f"{RELEASES_DIR}/{previous}.json")
+        if data is None:
+            raise FileNotFoundError(f"Release {previous} is missing from storage")
+        self._put(data, MANIFEST_KEY, MANIFEST_CACHE_CONTROL)
+        return previous
+
+    def upload_file(self, source_file_path, key):
+        """Publish one file and return its folder URL, or None on failure."""
+        try:
+            self.publish(source_file_path, key)
+            return self.folder_url(key)
+        except Exception as e:
+            print(f"❌ Failed to publish {key}: {e}")
+            return None
+
+    def upload_many(self, items):
+        """Publish (source, key) pairs and return a PublishResult."""
+        result = PublishResult(self)
+        for source, key in items:
+            try:
+                if self.publish(source, key):
+                    result.uploaded.append(key)
+                else:
+                    result.skipped.append(key)
+            except Exception as e:
+                print(f"❌ Failed to publish {key}: {e}")
+                result.failed[key] = str(e)
+        return result
+
+
+class GCSBackend(StorageBackend):
+    """Publishes to a GCS bucket through the shared gcp_access uploader."""
+
+    def __init__(self, bucket_name, prefix=DEFAULT_PREFIX, mode=DIRECT):
+        super().__init__(prefix, mode)
+        # Imported here so the local backend works without GCS credentials
+        from tabs_scripts.gcp import gcp_access
+        self.gcp_access = gcp_access
+        self.bucket_name = bucket_name
+
+    def base_url(self):
+        return f"https://storage.googleapis.com/{self.bucket_name}"
+
+    def _put(self, source, stored_key, cache_control):
+        uploader = self.gcp_access.get_uploader()
+        return uploader.put(self.bucket_name, source, self.object_name(stored_key), cache_control)
+
+    def read(self, key):
+        return self.gcp_access.get_uploader().read(self.bucket_name, self.object_name(key))
+
+    def upload_many(self, items):
+        stored = []
+        for source, key in items:
+            if self.mode == HASHED:
+                source = read_source(source)
+            stored.append((source, key, self.stored_key(key, source) if self.mode == HASHED else key))
+        bulk = self.gcp_access.upload_many(
+            self.bucket_name,
+            [(source, self.object_name(stored_key)) for source, _, stored_key in stored],
+            cache_control=self.cache_control()
+        )
+        result = PublishResult(self)
+        for _, key, stored_key in stored:
+            name = self.object_name(stored_key)
+            if name in bulk.failed:
+                result.failed[key] = bulk.failed[name]
+                continue
+            self._record(key, stored_key)
+            if name in bulk.uploaded:
+                result.uploaded.append(key)
+            else:
+                result.skipped.append(key)
+        return result
+
+
+class LocalBackend(StorageBackend):
+    """Publishes into a local directory, e.g. to render a full publish offline."""
+
+    def __init__(self, root=DEFAULT_LOCAL_DIR, prefix=DEFAULT_PREFIX, base_url=None, mode=DIRECT):
+        super().__init__(prefix, mode)
+        self.root = os.path.abspath(root)
+        self._base_url = (base_url or Path(self.root).as_uri()).rstrip("/")
+
+    def base_url(self):
+        return self._base_url
+
+    def path(self, key):
+        return os.path.join(self.root, *self.object_name(key).split("/"))
+
+    def read(self, key):
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _put(self, source, stored_key, cache_control):
+        # Headers only exist on served objects; the directory keeps just the bytes
+        data = read_source(source)
+        target = self.path(stored_key)
+        if os.path.exists(target):
+            with open(target, "rb") as f:
+                if hashlib.md5(f.read()).digest() == hashlib.md5(data).digest():
+                    return False
+
+        write_file(target, data)
+        return True
+
+
+def create_backend():
+    """Build the backend selected by STORAGE_BACKEND."""
+    kind = os.environ.get("STORAGE_BACKEND", "gcs").strip().lower()
+    prefix = os.environ.get("STORAGE_PREFIX", DEFAULT_PREFIX)
+    mode = PUBLISH_MODE
+    if kind == "local":
+        return LocalBackend(
+            root=os.environ.get("LOCAL_STORAGE_DIR", DEFAULT_LOCAL_DIR),
+            prefix=prefix,
+            base_url=os.environ.get("LOCAL_STORAGE_BASE_URL"),
+            mode=mode
+        )
+    if kind == "gcs":
+        return GCSBackend(os.environ.get("BUCKET_NAME"), prefix=prefix, mode=mode)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {kind}")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the process-wide storage backend, creating it on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+        return _backend
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """Return the process-wide PublishJournal, loading it on first use."""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = PublishJournal()
+        return _journal
+
+
+def _publish_planned(planned):
+    """Upload journaled (bytes, key, task id) triples and settle them in the journal."""
+    try:
+        backend = get_backend()
+    except Exception as e:
+        print(f"❌ Storage backend unavailable: {e}")
+        result = PublishResult(None)
+        result.failed = {key: str(e) for _, key, _ in planned}
+    else:
+        result = backend.upload_many([(data, key) for data, key, _ in planned])
+    get_journal().settle(planned, result.failed)
+    return result
+
+
+def upload_file(source_file_path, key):
+    """Publish one file under `key`; returns its folder URL or None on failure."""
+    result = upload_many([(source_file_path, key)])
+    if not result.ok:
+        print(f"❌ Failed to publish {key}: {result.failed[key]}")
+        return None
+    return result.folder_url(key)
+
+
+def upload_many(items):
+    """Publish (local path or bytes, key) pairs; returns a PublishResult.
+
+    Each upload is written to the publish journal first, so one that fails
+    or is interrupted is finished by resume_uploads() on a later run.
+    """
+    readable, unreadable = [], {}
+    for source, key in items:
+        try:
+            readable.append((read_source(source), key))
+        except OSError as e:
+            unreadable[key] = str(e)
+    result = _publish_planned(get_journal().plan(readable))
+    result.failed.update(unreadable)
+    return result
+
+
+def outstanding_uploads():
+    """Number of journaled uploads that have not completed."""
+    return len(get_journal())
+
+
+def resume_uploads():
+    """Finish the uploads an earlier run left outstanding; returns True when none remain."""
+    pending = get_journal().outstanding()
+    if not pending:
+        return True
+    print(f"🔁 Resuming {len(pending)} outstanding uploads")
+    return _publish_planned(pending).ok
+
+
+def publish_release(complete=True):
+    """Release a hashed-mode run (see StorageBackend.publish_release); returns the live release id."""
+    if PUBLISH_MODE != HASHED:
+        return None
+    try:
+        release_id = get_backend().publish_release(complete)
+    except Exception as e:
+        print(f"❌ Failed to publish release: {e}")
+        return None
+    if release_id:
+        print(f"✅ Release {release_id} is live")
+    return release_id
+
+
+def rollback_release():
+    """Make the previous release live again and return its id.
+
+    The local hashes are dropped as well, so the next upload compares every
+    tab against what is live again instead of what was rolled back.
+    """
+    release_id = get_backend().rollback_release()
+    save_sheet_fingerprints({})
+    clear_group_fingerprints()
+    print(f"↩️ Rolled back to release {release_id}")
+    return release_id
+
+
+def render_json(data, indent=2):
+    """Serialize `data` once, byte-for-byte as json.dump(indent=2, ensure_ascii=False) writes it."""
+    return json.dumps(data, indent=indent, ensure_ascii=False).encode("utf-8")
+
+
+def write_file(path, data):
+    """Atomically write bytes to a local path."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+_mirror_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="local-mirror")
+_mirror_pending = []
+_mirror_lock = threading.Lock()
+
+
+def mirror_file(path, data):
+    """Write a local copy of published bytes in the background.
+
+    Only for files nothing reads back during the run; pages that a later
+    extractor loads and updates must still be written synchronously.
+    """
+    if not MIRROR_ENABLED:
+        return
+    future = _mirror_pool.submit(write_file, path, data)
+    with _mirror_lock:
+        _mirror_pending.append(future)
+
+
+def flush_mirror():
+    """Wait for queued mirror writes; returns the number that failed."""
+    with _mirror_lock:
+        pending = list(_mirror_pending)
+        _mirror_pending.clear()
+    wait(pending)
+    failed = 0
+    for future in pending:
+        if future.exception() is not None:
+            print(f"⚠️ Failed to write local mirror file: {future.exception()}")
+            failed += 1
+    return failed
@@ -0,0 +1,100 @@
+import io
+import os
+import threading
+
+import openpyxl
+
+from tabs_scripts.fingerprints import sheet_fingerprint
+
+
+class WorkbookContext:
+    """Run-scoped view of an uploaded workbook.
+
+    The upload is read into memory once and opened by openpyxl in read-only
+    mode on first use; every extractor in the run then shares those bytes
+    instead of calling load_workbook itself. The read-only parser is not
+    thread-safe, so each thread gets its own workbook handle. Read-only
+    worksheets are parsed lazily as they are iterated, so stream them with
+    sheet_reader rather than random-access sheet.cell() lookups.
+    """
+
+    def __init__(self, excel_file):
+        if hasattr(excel_file, "getvalue"):
+            self.data = excel_file.getvalue()
+        elif hasattr(excel_file, "read"):
+            excel_file.seek(0)
+            self.data = excel_file.read()
+        else:
+            with open(excel_file, "rb") as f:
+                self.data = f.read()
+
+        self.name = getattr(excel_file, "name", os.path.basename(str(excel_file)))
+        self._workbooks = []
+        self._local = threading.local()
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    @property
+    def workbook(self):
+        """The calling thread's read-only workbook, opened on first use."""
+        workbook = getattr(self._local, "workbook", None)
+        with self._lock:
+            if workbook is not None and workbook in self._workbooks:
+                return workbook
+        workbook = self._local.workbook = open_workbook(self.data)
+        with self._lock:
+            self._workbooks.append(workbook)
+        return workbook
+
+    @property
+    def sheetnames(self):
+        return self.workbook.sheetnames
+
+    def sheet_fingerprint(self, sheet_name):
+        """Hash of the named sheet's values, or None if the sheet is missing."""
+        with self._lock:
+            if sheet_name in self._fingerprints:
+                return self._fingerprints[sheet_name]
+
+        workbook = self.workbook
+        fingerprint = None
+        if sheet_name in workbook.sheetnames:
+            fingerprint = sheet_fingerprint(workbook[sheet_name])
+
+        with self._lock:
+            self._fingerprints[sheet_name] = fingerprint
+        return fingerprint
+
+    def close(self):
+        with self._lock:
+            workbooks, self._workbooks = self._workbooks, []
+        for workbook in workbooks:
+            workbook.close()
+
+
+def open_workbook(data):
+    """Open workbook bytes read-only, with every sheet sized from its cells.
+
+    Read-only sheets otherwise trust the <dimension> tag saved in the file,
+    which some tools write stale or leave out: rows past it are dropped, or
+    rows come back shorter than the header.
+    """
+    # data_only=True returns cached formula results; number_format is still
+    # available on every cell for percentage handling.
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    for sheet in workbook.worksheets:
+        sheet.reset_dimensions()
+        try:
+            # Pads every row to the widest one
+            sheet.calculate_dimension(force=True)
+        except UnboundLocalError:
+            # openpyxl cannot size a sheet without cells; it yields no rows anyway
+            pass
+    return workbook
+
+
+def as_workbook_context(excel_file):
+    """Wrap a path/upload in a WorkbookContext unless it already is one."""
+    if isinstance(excel_file, WorkbookContext):
+        return excel_file
+    return WorkbookContext(excel_file)
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+from tabs_scripts import fingerprints
+from tabs_scripts.fingerprints import GroupFingerprints, clear_group_fingerprints, clear_remote_manifest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(fingerprints, "GROUP_FINGERPRINTS_DIR", str(tmp_path / "group_fingerprints"))
+    monkeypatch.setattr(fingerprints, "REMOTE_MANIFEST_PATH", str(tmp_path / "remote_manifest.json"))
+    return tmp_path
+
+
+def read_states(rows):
+    groups = GroupFingerprints("states")
+    for key, row in rows:
+        groups.add(key, row)
+    return groups
+
+
+def test_new_entities_are_changed():
+    groups = read_states([("KA", ["KA", 1]), ("TN", ["TN", 2])])
+
+    assert groups.changed("KA")
+    assert groups.changed("TN")
+
+
+def test_published_entities_are_unchanged_next_run():
+    rows = [("KA", ["KA", 1]), ("KA", ["KA", 2]), ("TN", ["TN", 3])]
+    groups = read_states(rows)
+    groups.mark_published("KA")
+    groups.mark_published("TN")
+    groups.save()
+
+    groups = read_states(rows)
+    assert not groups.changed("KA")
+    assert not groups.changed("TN")
+
+
+def test_only_edited_entity_is_changed():
+    groups = read_states([("KA", ["KA", 1]), ("TN", ["TN", 2])])
+    groups.mark_published("KA")
+    groups.mark_published("TN")
+    groups.save()
+
+    groups = read_states([("KA", ["KA", 1]), ("TN", ["TN", 20])])
+    assert not groups.changed("KA")
+    assert groups.changed("TN")
+
+
+def test_unpublished_entity_is_rebuilt():
+    rows = [("KA", ["KA", 1]), ("TN", ["TN", 2])]
+    groups = read_states(rows)
+    # TN's upload failed, so it is not marked
+    groups.mark_published("KA")
+    groups.save()
+
+    groups = read_states(rows)
+    assert not groups.changed("KA")
+    assert groups.changed("TN")
+
+
+def test_save_keeps_entities_not_read_this_run():
+    groups = read_states([("KA", ["KA", 1]), ("TN", ["TN", 2])])
+    groups.mark_published("KA")
+    groups.mark_published("TN")
+    groups.save()
+
+    groups = read_states([("KA", ["KA", 10])])
+    groups.mark_published("KA")
+    groups.save()
+
+    groups = read_states([("KA", ["KA", 10]), ("TN", ["TN", 2])])
+    assert not groups.changed("KA")
+    assert not groups.changed("TN")
+
+
+def test_row_order_within_entity_counts():
+    groups = read_states([("KA", ["KA", 1]), ("KA", ["KA", 2])])
+    groups.mark_published("KA")
+    groups.save()
+
+    groups = read_states([("KA", ["KA", 2]), ("KA", ["KA", 1])])
+    assert groups.changed("KA")
+
+
+def test_clear_group_fingerprints_rebuilds_everything():
+    rows = [("KA", ["KA", 1])]
+    groups = read_states(rows)
+    groups.mark_published("KA")
+    groups.save()
+
+    clear_group_fingerprints()
+
+    assert read_states(rows).changed("KA")
+    # Nothing to clear is not an error
+    clear_group_fingerprints()
+
+
+def test_clear_remote_manifest(cache_dir):
+    path = cache_dir / "remote_manifest.json"
+    path.write_text("{}")
+
+    clear_remote_manifest()
+
+    assert not os.path.exists(path)
+    clear_remote_manifest()
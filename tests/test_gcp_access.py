@@ -0,0 +1,178 @@
+import gzip
+import hashlib
+import os
+import threading
+
+import pytest
+
+# gcp_access reads the service account from the environment when imported
+os.environ.setdefault("PRIVATE_KEY", "")
+
+from tabs_scripts.gcp import gcp_access  # noqa: E402
+
+GCSUploader = gcp_access.GCSUploader
+bytes_md5 = gcp_access.bytes_md5
+prepare_payload = gcp_access.prepare_payload
+
+BUCKET = "bucket"
+PAGE = b'{"title": "Shikshagraha", "rows": [' + b", ".join(b'{"value": %d}' % i for i in range(200)) + b"]}"
+
+
+class FakeAcl:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def save_predefined(self, predefined):
+        if self.name in self.bucket.failing_acls:
+            raise RuntimeError("403 Forbidden")
+        self.bucket.acls.append((self.name, predefined))
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.content_encoding = None
+        self.cache_control = None
+        self.md5_hash = None
+        self.acl = FakeAcl(bucket, name)
+        self.public_url = f"https://storage.googleapis.com/{BUCKET}/{name}"
+
+    def upload_from_string(self, data, content_type=None, predefined_acl=None):
+        self.md5_hash = bytes_md5(data)
+        self.data = data
+        self.bucket.objects[self.name] = self
+        self.bucket.uploads.append(self.name)
+
+
+class FakeBucket:
+    """The few google.cloud.storage.Bucket calls GCSUploader makes, kept in memory."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = []
+        self.acls = []
+        self.failing_acls = set()
+
+    def blob(self, name, chunk_size=None):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        return self.objects.get(name)
+
+
+@pytest.fixture
+def bucket(tmp_path, monkeypatch):
+    monkeypatch.setattr(gcp_access, "REMOTE_MANIFEST_PATH", str(tmp_path / "remote_manifest.json"))
+    monkeypatch.setattr(gcp_access, "_manifest", {})
+    monkeypatch.setattr(gcp_access, "_manifest_mtime", None)
+    monkeypatch.setattr(gcp_access, "_unsaved", {})
+    monkeypatch.setattr(gcp_access, "PUBLIC_ACCESS", "acl")
+    return FakeBucket()
+
+
+@pytest.fixture
+def uploader(bucket):
+    # Skip __init__: no credentials or storage client, just the fake bucket
+    uploader = GCSUploader.__new__(GCSUploader)
+    uploader._buckets = {BUCKET: bucket}
+    uploader._lock = threading.Lock()
+    uploader._verified_buckets = set()
+    return uploader
+
+
+def test_gzip_payload_is_byte_identical():
+    first = prepare_payload(PAGE, "pages/home.json")
+    second = prepare_payload(bytes(PAGE), "pages/home.json")
+
+    assert first == second
+    data, content_type, content_encoding = first
+    assert (content_type, content_encoding) == ("application/json", "gzip")
+    # mtime=0 in the gzip header
+    assert data[4:8] == b"\x00\x00\x00\x00"
+    assert gzip.decompress(data) == PAGE
+
+
+def test_small_or_binary_payload_is_not_gzipped():
+    assert prepare_payload(b"{}", "pages/tiny.json") == (b"{}", "application/json", None)
+    png = hashlib.sha256(b"png").digest() * 64
+    assert prepare_payload(png, "images/logo.png")[2] is None
+
+
+def test_unchanged_objects_are_skipped(uploader, bucket):
+    items = [(PAGE, "pages/home.json"), (b"{}", "pages/tiny.json")]
+    result = uploader.upload_many(BUCKET, items, cache_control="public, max-age=60")
+    assert sorted(result.uploaded) == ["pages/home.json", "pages/tiny.json"]
+
+    bucket.uploads.clear()
+    result = uploader.upload_many(BUCKET, items, cache_control="public, max-age=60")
+
+    assert result.ok
+    assert sorted(result.skipped) == ["pages/home.json", "pages/tiny.json"]
+    assert bucket.uploads == []
+
+
+def test_changed_object_is_uploaded_again(uploader, bucket):
+    uploader.upload_many(BUCKET, [(PAGE, "pages/home.json"), (b"{}", "pages/tiny.json")])
+    bucket.uploads.clear()
+
+    result = uploader.upload_many(BUCKET, [(PAGE + b" ", "pages/home.json"), (b"{}", "pages/tiny.json")])
+
+    assert result.uploaded == ["pages/home.json"]
+    assert result.skipped == ["pages/tiny.json"]
+    assert bucket.uploads == ["pages/home.json"]
+
+
+def test_cache_control_change_uploads_again(uploader, bucket):
+    uploader.put(BUCKET, PAGE, "pages/home.json", "public, max-age=60")
+
+    assert uploader.put(BUCKET, PAGE, "pages/home.json", "public, max-age=60") is False
+    assert uploader.put(BUCKET, PAGE, "pages/home.json", "public, max-age=31536000, immutable") is True
+    assert bucket.uploads == ["pages/home.json", "pages/home.json"]
+
+
+def test_manifest_survives_the_process(uploader, bucket, monkeypatch):
+    uploader.upload_many(BUCKET, [(PAGE, "pages/home.json")])
+    bucket.uploads.clear()
+    # A new process reads the manifest back from disk
+    monkeypatch.setattr(gcp_access, "_manifest", {})
+    monkeypatch.setattr(gcp_access, "_manifest_mtime", None)
+    # Without the manifest the object's metadata would be read instead
+    monkeypatch.setattr(bucket, "get_blob", None)
+
+    result = uploader.upload_many(BUCKET, [(PAGE, "pages/home.json")])
+
+    assert result.skipped == ["pages/home.json"]
+    assert bucket.uploads == []
+
+
+def test_existing_object_is_adopted_without_upload(uploader, bucket):
+    data, _, _ = prepare_payload(PAGE, "pages/home.json")
+    FakeBlob(bucket, "pages/home.json").upload_from_string(data)
+    bucket.uploads.clear()
+
+    result = uploader.upload_many(BUCKET, [(PAGE, "pages/home.json")])
+
+    assert result.skipped == ["pages/home.json"]
+    assert bucket.uploads == []
+    assert bucket.acls == [("pages/home.json", "publicRead")]
+
+    # Recorded once public, so the next batch neither uploads nor patches it
+    result = uploader.upload_many(BUCKET, [(PAGE, "pages/home.json")])
+    assert result.skipped == ["pages/home.json"]
+    assert len(bucket.acls) == 1
+
+
+def test_failed_acl_fails_its_own_batch(uploader, bucket):
+    data, _, _ = prepare_payload(PAGE, "pages/home.json")
+    FakeBlob(bucket, "pages/home.json").upload_from_string(data)
+    bucket.failing_acls.add("pages/home.json")
+
+    result = uploader.upload_many(BUCKET, [(PAGE, "pages/home.json"), (b"{}", "pages/tiny.json")])
+
+    assert list(result.failed) == ["pages/home.json"]
+    assert result.skipped == []
+    assert result.uploaded == ["pages/tiny.json"]
+    # Not recorded, so the next run tries to make it public again
+    assert gcp_access.cached_remote_md5(BUCKET, "pages/home.json") is None
@@ -0,0 +1,101 @@
+import pytest
+
+from tabs_scripts import storage
+from tabs_scripts.journal import PublishJournal
+from tabs_scripts.storage import LocalBackend
+
+
+class FlakyBackend(LocalBackend):
+    """LocalBackend whose uploads of `failing` keys raise."""
+
+    def __init__(self, root):
+        super().__init__(root=root, base_url="https://example.test")
+        self.failing = set()
+        self.puts = []
+
+    def _put(self, source, stored_key, cache_control):
+        if stored_key in self.failing:
+            raise OSError("connection reset")
+        self.puts.append(stored_key)
+        return super()._put(source, stored_key, cache_control)
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    backend = FlakyBackend(str(tmp_path / "published"))
+    monkeypatch.setattr(storage, "_backend", backend)
+    monkeypatch.setattr(storage, "_journal", new_journal(tmp_path))
+    return backend
+
+
+def new_journal(tmp_path):
+    """A journal loaded from disk, as the next run of the app would see it."""
+    return PublishJournal(path=str(tmp_path / "publish_journal.json"), payload_dir=str(tmp_path / "payloads"))
+
+
+def published(backend, key):
+    with open(backend.path(key), "rb") as f:
+        return f.read()
+
+
+def test_completed_uploads_leave_nothing_outstanding(backend, tmp_path):
+    result = storage.upload_many([(b"one", "a.json"), (b"two", "b.json")])
+
+    assert result.ok
+    assert storage.outstanding_uploads() == 0
+    assert new_journal(tmp_path).outstanding() == []
+
+
+def test_failed_upload_is_replayed_next_run(backend, tmp_path, monkeypatch):
+    backend.failing.add("b.json")
+    result = storage.upload_many([(b"one", "a.json"), (b"two", "b.json")])
+
+    assert set(result.failed) == {"b.json"}
+    assert storage.outstanding_uploads() == 1
+
+    # The next run replays the saved bytes without rendering anything
+    backend.failing.clear()
+    backend.puts.clear()
+    monkeypatch.setattr(storage, "_journal", new_journal(tmp_path))
+    assert storage.outstanding_uploads() == 1
+    assert storage.resume_uploads()
+
+    assert backend.puts == ["b.json"]
+    assert published(backend, "b.json") == b"two"
+    assert storage.outstanding_uploads() == 0
+    assert not list((tmp_path / "payloads").iterdir())
+
+
+def test_replay_that_fails_again_stays_outstanding(backend, tmp_path, monkeypatch):
+    backend.failing.add("a.json")
+    storage.upload_many([(b"one", "a.json")])
+
+    monkeypatch.setattr(storage, "_journal", new_journal(tmp_path))
+    assert not storage.resume_uploads()
+
+    journal = new_journal(tmp_path)
+    assert [(data, key) for data, key, _ in journal.outstanding()] == [(b"one", "a.json")]
+    assert [task["attempts"] for task in journal.tasks.values()] == [2]
+
+
+def test_newer_version_supersedes_failed_upload(backend, tmp_path, monkeypatch):
+    backend.failing.add("a.json")
+    storage.upload_many([(b"old", "a.json")])
+    backend.failing.clear()
+    storage.upload_many([(b"new", "a.json")])
+
+    monkeypatch.setattr(storage, "_journal", new_journal(tmp_path))
+    assert storage.outstanding_uploads() == 0
+    assert storage.resume_uploads()
+    assert published(backend, "a.json") == b"new"
+
+
+def test_interrupted_upload_is_dropped(tmp_path):
+    journal = new_journal(tmp_path)
+    # Planned but never settled, as when the process dies mid-upload
+    journal.plan([(b"one", "a.json")])
+
+    journal = new_journal(tmp_path)
+    assert len(journal) == 1
+    assert journal.outstanding() == []
+    assert len(journal) == 0
@@ -0,0 +1,184 @@
+import pytest
+
+from tabs_scripts import pipeline
+from tabs_scripts.image_jobs import _track
+from tabs_scripts.pipeline import BLOCKED, DONE, FAILED, SKIPPED, Stage, run_pipeline
+
+
+class FakeContext:
+    """Stands in for WorkbookContext: sheet name -> fingerprint."""
+
+    def __init__(self, fingerprints):
+        self.fingerprints = dict(fingerprints)
+
+    def sheet_fingerprint(self, sheet):
+        return self.fingerprints.get(sheet)
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    """Keep sheet fingerprints in memory and stub the storage and image hooks."""
+    state = {"fingerprints": {}, "exhausted": set(), "cleared": []}
+    monkeypatch.setattr(pipeline, "load_sheet_fingerprints", lambda: dict(state["fingerprints"]))
+    monkeypatch.setattr(pipeline, "save_sheet_fingerprints", lambda value: state.update(fingerprints=value))
+    monkeypatch.setattr(pipeline, "clear_group_fingerprints", lambda: state["cleared"].append("groups"))
+    monkeypatch.setattr(pipeline, "clear_remote_manifest", lambda: state["cleared"].append("manifest"))
+    monkeypatch.setattr(pipeline, "resume_uploads", lambda: True)
+    monkeypatch.setattr(pipeline, "resume_image_jobs", lambda: 0)
+    monkeypatch.setattr(pipeline, "flush_mirror", lambda: None)
+    monkeypatch.setattr(pipeline, "wait_for_image_jobs", lambda: None)
+    monkeypatch.setattr(pipeline, "outstanding_uploads", lambda: 0)
+    monkeypatch.setattr(pipeline, "publish_release", lambda complete=True: None)
+    monkeypatch.setattr(pipeline, "exhausted_images", lambda targets: set(targets) & state["exhausted"])
+    return state
+
+
+def recorder(calls, name, result=True):
+    def func(context):
+        calls.append(name)
+        return result
+    return func
+
+
+def statuses(stages):
+    return {stage.name: stage.status for stage in stages}
+
+
+def test_unchanged_stages_are_skipped(saved):
+    calls = []
+    context = FakeContext({"A": "a1", "B": "b1"})
+
+    def stages():
+        return [
+            Stage("a", recorder(calls, "a"), inputs=["A"]),
+            Stage("b", recorder(calls, "b"), inputs=["B"]),
+        ]
+
+    assert statuses(run_pipeline(stages(), context)) == {"a": DONE, "b": DONE}
+    assert saved["fingerprints"] == {"a": {"A": "a1"}, "b": {"B": "b1"}}
+
+    calls.clear()
+    context.fingerprints["B"] = "b2"
+    assert statuses(run_pipeline(stages(), context)) == {"a": SKIPPED, "b": DONE}
+    assert calls == ["b"]
+    assert saved["fingerprints"]["b"] == {"B": "b2"}
+
+
+def test_stage_without_inputs_always_runs(saved):
+    calls = []
+    for _ in range(2):
+        stages = run_pipeline([Stage("bundles", recorder(calls, "bundles"))], FakeContext({}))
+    assert statuses(stages) == {"bundles": DONE}
+    assert calls == ["bundles", "bundles"]
+    assert saved["fingerprints"] == {}
+
+
+def test_missing_sheet_is_never_skipped(saved):
+    calls = []
+    saved["fingerprints"] = {"a": {"A": None}}
+    stages = run_pipeline([Stage("a", recorder(calls, "a"), inputs=["A"])], FakeContext({}))
+
+    assert statuses(stages) == {"a": DONE}
+    assert calls == ["a"]
+
+
+def test_done_dependency_forces_unchanged_stage(saved):
+    calls = []
+    context = FakeContext({"A": "a1", "B": "b1"})
+    saved["fingerprints"] = {"a": {"A": "a0"}, "b": {"B": "b1"}}
+    stages = run_pipeline([
+        Stage("a", recorder(calls, "a"), inputs=["A"]),
+        Stage("b", recorder(calls, "b"), depends_on=["a"], inputs=["B"]),
+    ], context)
+
+    assert statuses(stages) == {"a": DONE, "b": DONE}
+    assert calls == ["a", "b"]
+
+
+def test_after_edge_orders_without_forcing(saved):
+    calls = []
+    context = FakeContext({"A": "a1", "B": "b1"})
+    saved["fingerprints"] = {"a": {"A": "a0"}, "b": {"B": "b1"}}
+    stages = run_pipeline([
+        Stage("a", recorder(calls, "a"), inputs=["A"]),
+        Stage("b", recorder(calls, "b"), after=["a"], inputs=["B"]),
+    ], context)
+
+    assert statuses(stages) == {"a": DONE, "b": SKIPPED}
+    assert calls == ["a"]
+
+
+def test_failure_blocks_dependents(saved):
+    calls = []
+    context = FakeContext({"A": "a1", "B": "b1", "C": "c1"})
+    saved["fingerprints"] = {"a": {"A": "a0"}, "b": {"B": "b1"}, "c": {"C": "c1"}}
+    stages = run_pipeline([
+        Stage("a", recorder(calls, "a", result=False), inputs=["A"]),
+        Stage("b", recorder(calls, "b"), depends_on=["a"], inputs=["B"]),
+        Stage("c", recorder(calls, "c"), depends_on=["b"], inputs=["C"]),
+        Stage("d", recorder(calls, "d"), after=["a"]),
+    ], context)
+
+    assert statuses(stages) == {"a": FAILED, "b": BLOCKED, "c": BLOCKED, "d": DONE}
+    assert calls == ["a", "d"]
+    assert isinstance(stages[0].error, RuntimeError)
+    # Failed and blocked stages run again next time
+    assert saved["fingerprints"] == {}
+
+
+def test_raising_stage_fails(saved):
+    def broken(context):
+        raise KeyError("column")
+
+    stages = run_pipeline([Stage("a", broken, inputs=["A"])], FakeContext({"A": "a1"}))
+
+    assert statuses(stages) == {"a": FAILED}
+    assert isinstance(stages[0].error, KeyError)
+
+
+def test_without_skip_unchanged_everything_runs(saved):
+    calls = []
+    saved["fingerprints"] = {"a": {"A": "a1"}}
+    stages = run_pipeline(
+        [Stage("a", recorder(calls, "a"), inputs=["A"])], FakeContext({"A": "a1"}), skip_unchanged=False
+    )
+
+    assert statuses(stages) == {"a": DONE}
+    assert calls == ["a"]
+    assert saved["cleared"] == ["groups", "manifest"]
+
+
+@pytest.mark.parametrize("stages, message", [
+    ([Stage("a", None, depends_on=["b"]), Stage("b", None, after=["a"])], "cycle"),
+    ([Stage("a", None, depends_on=["a"])], "cycle"),
+    ([Stage("a", None, depends_on=["missing"])], "unknown"),
+    ([Stage("a", None), Stage("a", None)], "unique"),
+])
+def test_invalid_graph_is_rejected(saved, stages, message):
+    with pytest.raises(ValueError, match=message):
+        run_pipeline(stages, FakeContext({}))
+
+
+def test_stage_with_exhausted_image_is_rendered_again(saved):
+    calls = []
+    context = FakeContext({"A": "a1", "B": "b1"})
+    saved["exhausted"] = {"images/logo"}
+
+    def logos(context):
+        calls.append("logos")
+        # The first render points at the image; the second leaves it out
+        _track("planned" if calls.count("logos") == 1 else "missing", "images/logo")
+
+    stages = run_pipeline([
+        Stage("logos", logos, inputs=["A"]),
+        Stage("bundle", recorder(calls, "bundle"), depends_on=["logos"], inputs=["B"]),
+        Stage("other", recorder(calls, "other"), inputs=["B"]),
+    ], context)
+
+    assert statuses(stages) == {"logos": DONE, "bundle": DONE, "other": DONE}
+    assert calls.count("logos") == 2
+    assert calls.count("bundle") == 2
+    assert calls.count("other") == 1
+    # Rendered without the image, so it is not skipped on the next run
+    assert "logos" not in saved["fingerprints"]
+    assert saved["fingerprints"]["other"] == {"B": "b1"}